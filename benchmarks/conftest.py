@@ -0,0 +1,33 @@
+import os
+
+import pytest
+import race_fixtures
+
+
+RACE_FIXTURES = dict()
+for field_size in race_fixtures.FIELD_SIZES:
+    for tie_pattern in sorted(race_fixtures.TIE_PATTERNS):
+        RACE_FIXTURES['{field_size}-runners-{tie_pattern}'.format(field_size=field_size, tie_pattern=tie_pattern)] = (race_fixtures.generate_race_fixture, field_size, race_fixtures.TIE_PATTERNS[tie_pattern])
+for path in race_fixtures.get_recorded_fixture_paths():
+    RACE_FIXTURES['recorded-' + os.path.splitext(os.path.basename(path))[0]] = (race_fixtures.load_race_fixture, path)
+
+FIELD_FIXTURE_NAMES = sorted([name for name in RACE_FIXTURES if name.endswith('-no_ties') or name.startswith('recorded-')])
+
+
+def load_fixture(name):
+
+    return RACE_FIXTURES[name][0](*RACE_FIXTURES[name][1:])
+
+
+@pytest.fixture(scope='session', params=sorted(RACE_FIXTURES))
+def race_fixture(request):
+    """Return every synthetic and recorded race fixture, covering all field sizes and tie patterns"""
+
+    return load_fixture(request.param)
+
+
+@pytest.fixture(scope='session', params=FIELD_FIXTURE_NAMES)
+def field_fixture(request):
+    """Return the synthetic race fixtures without ties for each field size, along with all recorded race fixtures"""
+
+    return load_fixture(request.param)
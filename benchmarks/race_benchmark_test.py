@@ -0,0 +1,29 @@
+import race_fixtures
+
+
+def build_race_with_results(fixture):
+
+    race = race_fixtures.build_race(fixture)
+    for runner in race.active_runners:
+        runner.result
+        runner.starting_price
+    return race
+
+
+def test_get_winning_combinations(benchmark, race_fixture):
+    """Benchmark enumerating the first four winning combinations for a race"""
+
+    race = build_race_with_results(race_fixture)
+
+    benchmark(race.get_winning_combinations, 4)
+
+
+def test_total_value(benchmark, race_fixture):
+    """Benchmark calculating the total value of a race with no cached winning values"""
+
+    race = build_race_with_results(race_fixture)
+
+    def setup():
+        race.property_cache.pop('winning_values', None)
+
+    benchmark.pedantic(lambda: race.total_value, setup=setup, rounds=1000)
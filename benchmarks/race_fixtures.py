@@ -0,0 +1,220 @@
+from datetime import datetime, timedelta
+import glob
+import os
+import random
+
+from bson import json_util
+import predictive_punter
+import pytz
+import racing_data
+
+
+FIXTURES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+FIELD_SIZES = (4, 8, 12, 16, 24)
+
+TIE_PATTERNS = {
+    'no_ties':              (),
+    'dead_heat_first':      (2,),
+    'dead_heat_second':     (1, 2),
+    'triple_dead_heat':     (3,),
+    'multiple_dead_heats':  (2, 1, 2)
+}
+
+TRACK_CONDITIONS = ('Firm 1', 'Good 3', 'Good 4', 'Soft 5', 'Soft 7', 'Heavy 8', 'Synthetic')
+
+TRACKS = ('Caulfield', 'Flemington', 'Kilmore', 'Moonee Valley', 'Sandown')
+
+
+class FixtureProvider:
+    """An in-memory stand-in for Provider that serves races built from fixtures without a database or web scraper"""
+
+    def __getattr__(self, name):
+        """Return a source method that raises a LookupError, since entities built from fixtures must already be linked via their property caches"""
+
+        if name.startswith('get_'):
+
+            def get_unlinked_entity(*args, **kwargs):
+                raise LookupError('{name} is not available for race fixtures'.format(name=name))
+
+            return get_unlinked_entity
+
+        raise AttributeError(name)
+
+    def get_sample_by_runner(self, runner):
+        """Generate a new sample for the specified runner"""
+
+        return predictive_punter.Sample(self, {'runner': runner}, predictive_punter.Sample.generate_sample(runner), _id=runner['_id'])
+
+    def get_samples_by_race(self, race):
+        """Generate new samples in a single batch for all active runners in the specified race that do not have one yet, and cache each sample on its runner"""
+
+        runners = [runner for runner in race.active_runners if 'sample' not in runner.property_cache]
+        for runner, values in zip(runners, predictive_punter.Sample.generate_samples(runners)):
+            runner.property_cache['sample'] = predictive_punter.Sample(self, {'runner': runner}, values, _id=runner['_id'])
+
+        return [runner.sample for runner in race.active_runners]
+
+    def save_all(self, entities):
+        """Discard the specified entities, since fixtures are never persisted"""
+
+        pass
+
+
+def build_race(fixture, provider=None):
+    """Return a new race entity with its meet, runners, horses, jockeys, trainers and performances built from the specified fixture"""
+
+    if provider is None:
+        provider = FixtureProvider()
+
+    meet = racing_data.Meet(provider, None, fixture['meet'])
+    race = racing_data.Race(provider, {'meet': meet}, fixture['race'])
+    meet.property_cache['races'] = [race]
+
+    runners = []
+    for values in fixture['runners']:
+
+        horse = racing_data.Horse(provider, None, values['horse'])
+        horse.property_cache['performances'] = [racing_data.Performance(provider, {'horse': horse}, performance) for performance in values['performances']]
+
+        jockey = racing_data.Jockey(provider, None, values['jockey']) if values['jockey'] is not None else None
+        trainer = racing_data.Trainer(provider, None, values['trainer']) if values['trainer'] is not None else None
+
+        runners.append(racing_data.Runner(provider, {'race': race, 'horse': horse, 'jockey': jockey, 'trainer': trainer}, values['runner']))
+
+    race.property_cache['runners'] = runners
+
+    return race
+
+
+def generate_results(field_size, tie_pattern):
+    """Return a list of results for a field of the specified size, where tie_pattern lists the number of runners sharing each leading result"""
+
+    results = []
+    for tied_count in tie_pattern:
+        result = len(results) + 1
+        results.extend([result] * tied_count)
+    while len(results) < field_size:
+        results.append(len(results) + 1)
+
+    return results[:field_size]
+
+
+def generate_race_fixture(field_size, tie_pattern, seed=0):
+    """Return a synthetic race fixture with the specified field size and tie pattern, with a deterministic form history for each runner"""
+
+    random_source = random.Random(seed)
+
+    date = pytz.utc.localize(datetime(2016, 2, 1))
+    track = 'Kilmore'
+    distance = random_source.choice((1000, 1200, 1400, 1600, 2000))
+    jockey_urls = ['https://www.punters.com.au/jockeys/jockey-{index}/'.format(index=index) for index in range(field_size)]
+
+    fixture = {
+        'meet': {'_id': 'meet', 'date': date, 'track': track},
+        'race': {
+            '_id':              'race',
+            'number':           1,
+            'distance':         distance,
+            'track_circ':       1600,
+            'track_straight':   300,
+            'track_condition':  'Good 4',
+            'start_time':       date
+        },
+        'runners': []
+    }
+
+    results = generate_results(field_size, tie_pattern)
+    random_source.shuffle(results)
+
+    for index in range(field_size):
+
+        horse_url = 'https://www.punters.com.au/horses/horse-{index}/'.format(index=index)
+
+        performances = []
+        performance_date = date
+        # The oldest performance always follows a spell, since racing_data cannot calculate the spell of a horse's first start
+        performance_count = random_source.randint(1, 40)
+        for performance_index in range(performance_count):
+            if performance_index < performance_count - 1:
+                performance_date -= timedelta(days=random_source.choice((7, 14, 21, 28, 120)))
+            else:
+                performance_date -= timedelta(days=120)
+            performance_distance = random_source.choice((1000, 1200, 1400, 1600, 2000))
+            performances.append({
+                'track':            random_source.choice(TRACKS),
+                'date':             performance_date,
+                'distance':         performance_distance,
+                'track_condition':  random_source.choice(TRACK_CONDITIONS),
+                'prize_money':      random_source.choice((None, 0.0, 1500.0, 12000.0)),
+                'prize_pool':       random_source.choice((None, 20000.0, 50000.0)),
+                'barrier':          random_source.randint(1, 16),
+                'winning_time':     round(performance_distance / random_source.uniform(15.5, 17.5), 2),
+                'starting_price':   round(random_source.uniform(1.5, 101.0), 2),
+                'horse_url':        horse_url,
+                'jockey_url':       random_source.choice(jockey_urls),
+                'weight':           random_source.uniform(52.0, 60.0),
+                'carried':          random_source.uniform(52.0, 60.0),
+                'lengths':          round(random_source.uniform(0.0, 12.0), 1),
+                'result':           random_source.randint(1, 14),
+                'starters':         14
+            })
+
+        performances.append({
+            'track':            track,
+            'date':             date,
+            'distance':         distance,
+            'track_condition':  'Good 4',
+            'prize_money':      None,
+            'prize_pool':       50000.0,
+            'barrier':          index + 1,
+            'winning_time':     round(distance / 16.5, 2),
+            'starting_price':   random_source.choice((None, round(random_source.uniform(1.5, 101.0), 2))),
+            'horse_url':        horse_url,
+            'jockey_url':       jockey_urls[index],
+            'weight':           57.0,
+            'carried':          57.0,
+            'lengths':          0.0,
+            'result':           results[index],
+            'starters':         field_size
+        })
+
+        fixture['runners'].append({
+            'runner': {
+                '_id':              'runner-{index}'.format(index=index),
+                'number':           index + 1,
+                'barrier':          index + 1,
+                'weight':           57.0,
+                'jockey_claiming':  random_source.choice((0.0, 0.0, 1.5, 3.0)),
+                'is_scratched':     False,
+                'horse_url':        horse_url,
+                'jockey_url':       jockey_urls[index],
+                'trainer_url':      None
+            },
+            'horse':        {'url': horse_url, 'foaled': date - timedelta(days=random_source.randint(730, 3650))},
+            'jockey':       {'url': jockey_urls[index]},
+            'trainer':      None,
+            'performances': performances
+        })
+
+    return fixture
+
+
+def load_race_fixture(path):
+    """Load a race fixture recorded by record_fixtures.py from the specified path"""
+
+    with open(path, 'r') as fixture_file:
+        return json_util.loads(fixture_file.read())
+
+
+def save_race_fixture(path, fixture):
+    """Save the specified race fixture to path"""
+
+    with open(path, 'w') as fixture_file:
+        fixture_file.write(json_util.dumps(fixture, indent=4, sort_keys=True))
+
+
+def get_recorded_fixture_paths():
+    """Return a sorted list of the paths to all recorded race fixtures"""
+
+    return sorted(glob.glob(os.path.join(FIXTURES_PATH, '*.json')))
@@ -0,0 +1,55 @@
+"""Record race fixtures for the benchmark suite from the races on the specified date(s)
+
+Usage: python benchmarks/record_fixtures.py [-d <database_uri>] [-r <redis_uri>] date_from [date_to]
+
+Races are loaded via the same provider as the scrape command, so the database will be populated from www.punters.com.au if necessary.
+"""
+
+import os
+import re
+import sys
+
+import predictive_punter
+from predictive_punter.date_utils import dates
+import race_fixtures
+
+
+def record_race_fixture(race):
+    """Return a fixture containing the values of the specified race and all associated entities required to generate samples"""
+
+    return {
+        'meet':     dict(race.meet),
+        'race':     dict(race),
+        'runners':  [{
+            'runner':       dict(runner),
+            'horse':        dict(runner.horse),
+            'jockey':       dict(runner.jockey) if runner.jockey is not None else None,
+            'trainer':      dict(runner.trainer) if runner.trainer is not None else None,
+            'performances': [dict(performance) for performance in runner.horse.performances]
+        } for runner in race.runners]
+    }
+
+
+def main():
+    """Record a fixture for each race with a horse for every runner on the specified date(s)"""
+
+    config = predictive_punter.ScrapeCommand.parse_args(sys.argv[1:])
+    command = predictive_punter.ScrapeCommand(**config)
+
+    try:
+        os.makedirs(race_fixtures.FIXTURES_PATH, exist_ok=True)
+
+        for date in dates(config['date_from'], config['date_to']):
+            for meet in command.provider.get_meets_by_date(date):
+                for race in meet.races:
+                    if len(race.runners) > 0 and all([runner.horse is not None for runner in race.runners]):
+
+                        file_name = '{date:%Y-%m-%d}-{track}-race-{number}.json'.format(date=date, track=re.sub('[^a-z0-9]+', '-', meet['track'].lower()), number=race['number'])
+                        race_fixtures.save_race_fixture(os.path.join(race_fixtures.FIXTURES_PATH, file_name), record_race_fixture(race))
+
+    finally:
+        command.worker_pool.shutdown()
+
+
+if __name__ == '__main__':
+    main()
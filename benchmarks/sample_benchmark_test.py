@@ -0,0 +1,55 @@
+import predictive_punter
+import race_fixtures
+
+
+ROUNDS = 10
+
+
+def test_generate_sample(benchmark, field_fixture):
+    """Benchmark generating the raw query data for every runner in a freshly loaded race"""
+
+    def setup():
+        return (race_fixtures.build_race(field_fixture),), {}
+
+    def generate_samples(race):
+        return [predictive_punter.Sample.generate_sample(runner) for runner in race.active_runners]
+
+    benchmark.pedantic(generate_samples, setup=setup, rounds=ROUNDS)
+
+
+def test_generate_race_samples(benchmark, field_fixture):
+    """Benchmark generating the raw query data for every runner in a freshly loaded race as a single matrix"""
+
+    def setup():
+        return (race_fixtures.build_race(field_fixture),), {}
+
+    def generate_samples(race):
+        return predictive_punter.Sample.generate_samples(race.active_runners)
+
+    benchmark.pedantic(generate_samples, setup=setup, rounds=ROUNDS)
+
+
+def setup_samples(fixture):
+
+    race = race_fixtures.build_race(fixture)
+    for runner in race.active_runners:
+        runner.sample
+    return (race,), {}
+
+
+def test_imputed_query_data(benchmark, field_fixture):
+    """Benchmark imputing the query data for every runner in a race from freshly generated samples"""
+
+    def get_imputed_query_data(race):
+        return [runner.sample.imputed_query_data for runner in race.active_runners]
+
+    benchmark.pedantic(get_imputed_query_data, setup=lambda: setup_samples(field_fixture), rounds=ROUNDS)
+
+
+def test_normalized_query_data(benchmark, field_fixture):
+    """Benchmark normalizing the query data for every runner in a race from freshly generated samples"""
+
+    def get_normalized_query_data(race):
+        return [runner.sample.normalized_query_data for runner in race.active_runners]
+
+    benchmark.pedantic(get_normalized_query_data, setup=lambda: setup_samples(field_fixture), rounds=ROUNDS)
@@ -3,9 +3,15 @@ __version__ = '1.0.0a4'
 
 from . import race
 from . import runner
+from .feature_store import FeatureStore
 from .sample import Sample
 from .provider import Provider
+from .pooled_scraper import PooledScraper
+from .process_pool_scraper import ProcessPoolScraper
+from .async_scraper import AsyncScraper
+from .worker_pool import WorkerPool
 
 from .command import Command
 from .scrape import ScrapeCommand
 from .seed import SeedCommand
+from .export import ExportCommand
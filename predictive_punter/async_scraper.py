@@ -0,0 +1,18 @@
+import punters_client
+
+from .http_utils import FetchedPageHTTPClient
+
+
+class AsyncScraper(punters_client.Scraper):
+    """Extend the punters_client Scraper class to parse pages fetched by coroutines"""
+
+    def __init__(self, html_parser, *args, **kwargs):
+
+        super().__init__(FetchedPageHTTPClient(), html_parser, *args, **kwargs)
+
+    def get_html(self, url, *args, **kwargs):
+        """Get the root HTML element from the fetched page at the specified URL"""
+
+        response = self.http_client.get(url)
+        response.raise_for_status()
+        return self.parse_html(response.text)
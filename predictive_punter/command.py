@@ -1,64 +1,178 @@
+import asyncio
 import concurrent.futures
 from datetime import datetime
 from getopt import getopt
 import logging
+import multiprocessing
+import multiprocessing.util
+import signal
+import threading
 import time
+import traceback
 
-import cache_requests
 from lxml import html
-import punters_client
 import pymongo
-import redis
-import requests
+import racing_data
 
-from . import Provider
+from . import AsyncScraper, PooledScraper, ProcessPoolScraper, Provider, WorkerPool
 from .date_utils import *
+from .http_utils import *
 from .profiling_utils import *
 
 
+worker_command = None
+
+
+def initialize_worker(command_type, config):
+    """Create the command instance used to process dates in a worker process"""
+
+    global worker_command
+    worker_command = command_type(**dict(config, backup_database=False, incremental_backups=False, metrics_path=None, parse_processes=None, processes=1))
+    metrics.enabled = config['metrics_path'] is not None
+
+    # Workers journal their changes for the parent's incremental backups
+    worker_command.provider.journal_changes = config['incremental_backups']
+
+    # Shut down when the worker process exits rather than after each date
+    multiprocessing.util.Finalize(worker_command, worker_command.shutdown, exitpriority=10)
+
+
+def process_date_in_worker(date):
+    """Process the specified date in a worker process and return its results"""
+
+    error = None
+    try:
+        worker_command.profile(worker_command.process_dates, date, date)
+    except BaseException:
+        error = traceback.format_exc()
+
+    profile_stats = worker_command.profiler.pop_stats() if worker_command.profiler is not None else None
+
+    return date, error, worker_command.provider.pop_journal(), metrics.pop_state(), profile_stats
+
+
 class Command:
     """Common functionality for command line utilities"""
 
+    CHECKPOINT_TYPES = (racing_data.Meet, racing_data.Race)
+
+    RETRY_DELAY = 1.0
+
     @classmethod
     def main(cls, args):
         """Main entry point for console script"""
 
         config = cls.parse_args(args)
         command = cls(**config)
-        log_time('processing dates from {date_from:%Y-%m-%d} to {date_to:%Y-%m-%d}'.format(date_from=config['date_from'], date_to=config['date_to']), command.process_dates, config['date_from'], config['date_to'])
+        try:
+            command.profile(log_time, 'processing dates from {0:%Y-%m-%d} to {1:%Y-%m-%d}', command.process_dates, config['date_from'], config['date_to'])
+        finally:
+            command.shutdown()
+            command.dump_metrics()
+            command.dump_profile()
 
     @classmethod
     def parse_args(cls, args):
         """Return a dictionary of configuration values based on the provided command line arguments"""
         
         config = {
+            'async_mode':       False,
             'backup_database':  False,
+            'capture_path':     None,
             'database_uri':     'mongodb://localhost:27017/predictive_punter',
+            'incremental_backups':  False,
             'date_from':        datetime.now(),
             'date_to':          datetime.now(),
+            'export_path':      'samples',
+            'force':            False,
+            'http_cache_size':  256,
             'logging_level':    logging.INFO,
-            'redis_uri':        'redis://localhost:6379/predictive_punter'
+            'max_http_concurrency': None,
+            'metrics_path':     None,
+            'parse_processes':  None,
+            'processes':        1,
+            'query_data_dtype': None,
+            'rate_limit':       None,
+            'profile_path':     None,
+            'redis_uri':        'redis://localhost:6379/predictive_punter',
+            'replay':           False,
+            'resume':           False,
+            'retries':          2,
+            'workers':          None
         }
 
-        opts, args = getopt(args, 'bd:qr:v', ['backup-database', 'database-uri=', 'quiet', 'redis-uri=', 'verbose'])
+        opts, args = getopt(args, 'abc:d:im:o:p:qr:vw:', ['async', 'backup-database', 'capture-path=', 'database-uri=', 'export-path=', 'force', 'http-cache-size=', 'incremental-backups', 'max-http-concurrency=', 'metrics-path=', 'parse-processes=', 'processes=', 'profile=', 'query-data-dtype=', 'quiet', 'rate-limit=', 'redis-uri=', 'replay', 'resume', 'retries=', 'verbose', 'workers='])
 
         for opt, arg in opts:
 
-            if opt in ('-b', '--backup-database'):
+            if opt in ('-a', '--async'):
+                config['async_mode'] = True
+
+            elif opt in ('-b', '--backup-database'):
                 config['backup_database'] = True
 
+            elif opt in ('-c', '--capture-path'):
+                config['capture_path'] = arg
+
             elif opt in ('-d', '--database-uri'):
                 config['database_uri'] = arg
 
+            elif opt == '--force':
+                config['force'] = True
+
+            elif opt == '--http-cache-size':
+                config['http_cache_size'] = int(arg)
+
+            elif opt in ('-i', '--incremental-backups'):
+                config['backup_database'] = config['incremental_backups'] = True
+
+            elif opt == '--max-http-concurrency':
+                config['max_http_concurrency'] = int(arg)
+
+            elif opt in ('-m', '--metrics-path'):
+                config['metrics_path'] = arg
+
+            elif opt in ('-o', '--export-path'):
+                config['export_path'] = arg
+
+            elif opt == '--parse-processes':
+                config['parse_processes'] = int(arg)
+
+            elif opt in ('-p', '--processes'):
+                config['processes'] = int(arg)
+
+            elif opt == '--profile':
+                config['profile_path'] = arg
+
+            elif opt == '--query-data-dtype':
+                if arg not in ('float32', 'float64'):
+                    raise ValueError('The query data dtype must be float32 or float64')
+                config['query_data_dtype'] = arg
+
             elif opt in ('-q', '--quiet'):
                 config['logging_level'] = logging.WARNING
 
+            elif opt == '--rate-limit':
+                config['rate_limit'] = float(arg)
+
             elif opt in ('-r', '--redis-uri'):
                 config['redis_uri'] = arg
 
+            elif opt == '--replay':
+                config['replay'] = True
+
+            elif opt == '--resume':
+                config['resume'] = True
+
+            elif opt == '--retries':
+                config['retries'] = int(arg)
+
             elif opt in ('-v', '--verbose'):
                 config['logging_level'] = logging.DEBUG
 
+            elif opt in ('-w', '--workers'):
+                config['workers'] = int(arg)
+
         if len(args) > 0:
             config['date_from'] = config['date_to'] = datetime.strptime(args[-1], '%Y-%m-%d')
             if len(args) > 1:
@@ -70,80 +184,273 @@ class Command:
 
         logging.basicConfig(level=kwargs['logging_level'])
 
+        self.config = kwargs
+        self.process_count = kwargs['processes']
+
         database_client = pymongo.MongoClient(kwargs['database_uri'])
         self.database = database_client.get_default_database()
         self.do_database_backups = kwargs['backup_database']
+        self.do_incremental_backups = kwargs['incremental_backups']
+        self.has_full_backup = False
 
-        http_client = None
-        try:
-            http_client = cache_requests.Session(connection=redis.fromurl(kwargs['redis_uri']))
-        except BaseException:
-            try:
-                http_client = cache_requests.Session()
-            except BaseException:
-                http_client = requests.Session()
+        self.max_retries = kwargs['retries']
+        self.do_resume = kwargs['resume']
+        self.do_force = kwargs['force']
+
+        self.profile_path = kwargs['profile_path']
+        self.profiler = ThreadProfiler() if self.profile_path is not None else None
+
+        self.worker_pool = WorkerPool(kwargs['workers'], self.profiler)
+
+        self.event_loop = self.blocking_executor = self.async_http_client = None
+        if kwargs['async_mode']:
+            self.event_loop = asyncio.new_event_loop()
+            self.blocking_executor = concurrent.futures.ThreadPoolExecutor(self.worker_pool.max_workers)
+            self.async_http_client = AsyncHTTPClient(self.event_loop, kwargs['max_http_concurrency'])
+
+        self.metrics_path = kwargs['metrics_path']
+
+        http_client = create_http_client(kwargs['redis_uri'], self.worker_pool.max_workers + 1, max_concurrency=kwargs['max_http_concurrency'], rate_limit=kwargs['rate_limit'], cache_size=kwargs['http_cache_size'], async_http_client=self.async_http_client, instrument=self.metrics_path is not None)
+
+        if kwargs['capture_path'] is not None:
+            http_client = CaptureHTTPClient(http_client, kwargs['capture_path'], CaptureHTTPClient.REPLAY if kwargs['replay'] else CaptureHTTPClient.RECORD)
 
         html_parser = html.fromstring
 
-        scraper = punters_client.Scraper(http_client, html_parser)
+        if self.metrics_path is not None:
+            metrics.enabled = True
+            html_parser = timed('html.parse')(html_parser)
+            if hasattr(signal, 'SIGUSR1'):
+                # Dump from another thread, since the main thread may hold the metrics lock
+                signal.signal(signal.SIGUSR1, lambda signal_number, frame: threading.Thread(target=self.dump_metrics, daemon=True).start())
+
+        # In async mode, pages are fetched via http_client and served to the scraper
+        self.http_client = http_client
+
+        self.parse_pool = None
+        if kwargs['parse_processes'] is not None:
+            self.parse_pool = concurrent.futures.ProcessPoolExecutor(kwargs['parse_processes'])
+            # Start the worker processes before any worker threads, so that they are not forked while other threads hold locks
+            self.parse_pool.submit(int).result()
+            scraper = ProcessPoolScraper(FetchedPageHTTPClient() if self.event_loop is not None else http_client, self.parse_pool)
+        elif self.event_loop is not None:
+            scraper = AsyncScraper(html_parser)
+        else:
+            scraper = PooledScraper(http_client, html_parser, concurrent_requests=self.worker_pool.max_workers + 1)
         
-        self.provider = Provider(self.database, scraper)
+        self.provider = Provider(self.database, scraper, query_data_dtype=kwargs['query_data_dtype'], journal_changes=kwargs['incremental_backups'])
+
+    def shutdown(self):
+        """Shut down the command's pools and asyncio resources"""
+
+        self.worker_pool.shutdown()
+
+        if self.parse_pool is not None:
+            self.parse_pool.shutdown()
+
+        if self.event_loop is not None:
+            self.async_http_client.close()
+            self.blocking_executor.shutdown()
+            self.event_loop.close()
 
     def backup_database(self):
         """Backup the database if backup_database is available"""
 
-        for backup_name in [collection for collection in self.database.collection_names(False) if '_backup' in collection]:
-            self.database.drop_collection(backup_name)
+        self.provider.flush()
+
+        if self.do_incremental_backups and self.has_full_backup:
+            self.backup_database_changes(self.provider.pop_journal())
+
+        else:
+            self.provider.pop_journal()
+
+            for backup_name in [collection for collection in self.database.collection_names(False) if '_backup' in collection]:
+                self.database.drop_collection(backup_name)
 
-        for collection_name in [collection for collection in self.database.collection_names(False) if '_backup' not in collection]:
-            backup_name = collection_name + '_backup'
-            self.database[collection_name].aggregate([{'$out': backup_name}])
+            for collection_name in [collection for collection in self.database.collection_names(False) if '_backup' not in collection]:
+                backup_name = collection_name + '_backup'
+                self.database[collection_name].aggregate([{'$out': backup_name}])
+
+            self.has_full_backup = True
+
+    def backup_database_changes(self, journal, batch_size=1000):
+        """Backup only the documents in the specified change journal"""
+
+        for collection_name in journal:
+            entity_ids = list(journal[collection_name])
+            for index in range(0, len(entity_ids), batch_size):
+
+                requests = [pymongo.ReplaceOne({'_id': values['_id']}, values, upsert=True) for values in self.database[collection_name].find({'_id': {'$in': entity_ids[index:index + batch_size]}})]
+                if len(requests) > 0:
+                    self.database[collection_name + '_backup'].bulk_write(requests, ordered=False)
 
     def restore_database(self):
         """Restore the database if backup_database is available"""
 
-        for collection_name in [collection for collection in self.database.collection_names(False) if '_backup' not in collection]:
-            self.database.drop_collection(collection_name)
+        self.provider.flush()
+
+        if self.do_incremental_backups and self.has_full_backup:
+            self.restore_database_changes(self.provider.pop_journal())
+
+        else:
+            self.provider.pop_journal()
+
+            for collection_name in [collection for collection in self.database.collection_names(False) if '_backup' not in collection]:
+                self.database.drop_collection(collection_name)
+
+            for backup_name in [collection for collection in self.database.collection_names(False) if '_backup' in collection]:
+                collection_name = backup_name.replace('_backup', '')
+                self.database[backup_name].aggregate([{'$out': collection_name}])
+
+    def restore_database_changes(self, journal, batch_size=1000):
+        """Restore only the documents in the specified change journal"""
+
+        for collection_name in journal:
+            entity_ids = list(journal[collection_name])
+            for index in range(0, len(entity_ids), batch_size):
+                batch_ids = entity_ids[index:index + batch_size]
+
+                backup_values = list(self.database[collection_name + '_backup'].find({'_id': {'$in': batch_ids}}))
+                requests = [pymongo.ReplaceOne({'_id': values['_id']}, values, upsert=True) for values in backup_values]
+
+                backup_ids = set([values['_id'] for values in backup_values])
+                new_ids = [entity_id for entity_id in batch_ids if entity_id not in backup_ids]
+                if len(new_ids) > 0:
+                    requests.append(pymongo.DeleteMany({'_id': {'$in': new_ids}}))
+
+                if len(requests) > 0:
+                    self.database[collection_name].bulk_write(requests, ordered=False)
+
+    def dump_metrics(self):
+        """Write the metrics to the metrics path if one was specified"""
+
+        if self.metrics_path is not None:
+            metrics.dump(self.metrics_path)
 
-        for backup_name in [collection for collection in self.database.collection_names(False) if '_backup' in collection]:
-            collection_name = backup_name.replace('_backup', '')
-            self.database[backup_name].aggregate([{'$out': collection_name}])
+    def dump_profile(self):
+        """Write the profile to the profile path if one was specified"""
+
+        if self.profiler is not None:
+            self.profiler.dump(self.profile_path)
+
+    def profile(self, target, *target_args):
+        """Call target under the profiler if profiling is enabled"""
+
+        if self.profiler is not None:
+            return self.profiler.profile(target, *target_args)
+        return target(*target_args)
+
+    @property
+    def feature_schema_version(self):
+        """Return the feature schema version this command depends on, if any"""
+
+        return None
+
+    def has_checkpoint(self, unit):
+        """Return True if the specified unit has already been processed"""
+
+        return not self.do_force and (isinstance(unit, datetime) or isinstance(unit, self.CHECKPOINT_TYPES)) and self.provider.has_checkpoint(self.__class__.__name__, unit, self.feature_schema_version)
+
+    def save_checkpoint(self, unit):
+        """Record that the specified unit has been processed"""
+
+        unit_date = self.provider.get_meet_date(unit) if isinstance(unit, datetime) else self.provider.get_date_by_entity(unit)
+        if unit_date < self.provider.get_meet_date(datetime.now()):
+            self.provider.save_checkpoint(self.__class__.__name__, unit, self.feature_schema_version)
 
     def process_collection(self, collection, target):
         """Asynchronously process all items in collection via target"""
 
-        if len(collection) > 0:
+        futures = dict()
+        is_complete = True
 
-            with concurrent.futures.ThreadPoolExecutor() as executor:
+        for item in collection:
+            futures[self.worker_pool.submit(self.process_item, target, item)] = item
+            while len(futures) >= self.worker_pool.max_workers:
+                is_complete = self.complete_futures(futures) and is_complete
 
-                def process_item(item, retry_count=0, max_retries=5):
-                    try:
-                        return executor.submit(log_time, 'processing {item}'.format(item=item), target, item)
-                    except RuntimeError:
-                        if retry_count < max_retries:
-                            time.sleep(1)
-                            return process_item(item, retry_count + 1, max_retries)
-                        else:
-                            raise
+        while len(futures) > 0:
+            is_complete = self.complete_futures(futures) and is_complete
 
-                futures = {process_item(item): item for item in collection}
+        return is_complete
 
-                for future in concurrent.futures.as_completed(futures):
-                    if future.exception() is not None:
-                        logging.critical('An exception occurred while processing {item}'.format(item=futures[future]))
-                        raise future.exception()
+    def complete_futures(self, futures):
+        """Wait for and remove the next completed futures"""
+
+        completed_futures, pending_futures = concurrent.futures.wait(futures, return_when=concurrent.futures.FIRST_COMPLETED)
+        is_complete = True
+
+        for future in completed_futures:
+            item = futures.pop(future)
+            if future.exception() is not None:
+                logging.critical('An exception occurred while processing {item}'.format(item=item))
+                concurrent.futures.wait(futures)
+                raise future.exception()
+            is_complete = future.result() and is_complete
+
+        return is_complete
 
     def process_dates(self, date_from, date_to):
         """Process all racing data for the specified date range"""
 
-        for date in dates(date_from, date_to):
-            log_time('processing date {date:%Y-%m-%d}'.format(date=date), self.process_date, date)
+        if self.process_count > 1:
+            self.process_dates_in_workers(date_from, date_to)
+
+        elif self.event_loop is not None:
+            self.event_loop.run_until_complete(self.process_dates_async(date_from, date_to))
+
+        else:
+            for date in dates(date_from, date_to):
+                log_time('processing date {0:%Y-%m-%d}', self.process_date, date)
+
+    def process_dates_in_workers(self, date_from, date_to):
+        """Process all racing data for the specified date range in worker processes"""
+
+        all_dates = list(dates(date_from, date_to))
+        batch_size = self.process_count if self.do_database_backups else len(all_dates)
+        processed_count = 0
+
+        with multiprocessing.get_context('spawn').Pool(self.process_count, initialize_worker, (self.__class__, self.config)) as pool:
+
+            for batch_index in range(0, len(all_dates), batch_size):
+
+                failed_dates = []
+                for date, error, journal, metrics_state, profile_stats in pool.imap_unordered(process_date_in_worker, all_dates[batch_index:batch_index + batch_size]):
+                    processed_count += 1
+                    for collection_name in journal:
+                        self.provider.record_changes(collection_name, journal[collection_name])
+                    metrics.merge_state(metrics_state)
+                    if self.profiler is not None:
+                        self.profiler.merge_stats(profile_stats)
+                    if error is None:
+                        logging.info('Finished processing date {date:%Y-%m-%d} ({count} of {total})'.format(date=date, count=processed_count, total=len(all_dates)))
+                    else:
+                        logging.critical('An exception occurred while processing date {date:%Y-%m-%d}:\n{error}'.format(date=date, error=error))
+                        failed_dates.append(date)
+
+                if len(failed_dates) > 0:
+                    if self.do_database_backups:
+                        log_time('restoring database from backup', self.restore_database)
+                    raise RuntimeError('Failed to process dates {dates}'.format(dates=', '.join(['{date:%Y-%m-%d}'.format(date=date) for date in sorted(failed_dates)])))
+
+                elif self.do_database_backups:
+                    log_time('backing up the database', self.backup_database)
 
     def process_date(self, date):
         """Process all racing data for the specified date"""
 
+        if not self.do_resume and self.has_checkpoint(date):
+            logging.info('Skipping date {date:%Y-%m-%d}, which has already been processed'.format(date=date))
+            return
+
         try:
-            self.process_collection(self.provider.get_meets_by_date(date), self.process_meet)
+            if self.do_resume:
+                is_complete = self.resume_date(date)
+            else:
+                is_complete = self.process_collection(self.provider.get_meets_by_date(date), self.process_meet)
+            if is_complete:
+                self.save_checkpoint(date)
+            self.provider.flush()
 
         except BaseException:
             logging.critical('An exception occurred while processing date {date:%Y-%m-%d}'.format(date=date))
@@ -155,27 +462,72 @@ class Command:
             if self.do_database_backups:
                 log_time('backing up the database', self.backup_database)
 
+    def resume_date(self, date):
+        """Reprocess the failed items for the specified date"""
+
+        if len(self.provider.find(racing_data.Meet, {'date': self.provider.get_meet_date(date)}, None)) < 1:
+            return self.process_collection(self.provider.get_meets_by_date(date), self.process_meet)
+
+        is_complete = True
+        for entity_type, target in ((racing_data.Meet, self.process_meet), (racing_data.Race, self.process_race), (racing_data.Runner, self.process_runner)):
+            is_complete = self.process_collection(self.provider.get_failed_entities(self.__class__.__name__, date, entity_type), target) and is_complete
+
+        return is_complete
+
+    def process_item(self, target, item):
+        """Process item via target with retries"""
+
+        if self.has_checkpoint(item):
+            logging.debug('Skipping {item}, which has already been processed'.format(item=item))
+            return True
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                output = log_time('processing {0}', target, item)
+
+            except Exception:
+                if attempt < self.max_retries:
+                    logging.warning('Retrying {item} after an exception occurred:\n{error}'.format(item=item, error=traceback.format_exc()))
+                    time.sleep(self.RETRY_DELAY * (2 ** attempt))
+                else:
+                    logging.critical('An exception occurred while processing {item}:\n{error}'.format(item=item, error=traceback.format_exc()))
+                    self.provider.save_failure(self.__class__.__name__, item, traceback.format_exc())
+
+            else:
+                if self.do_resume:
+                    self.provider.remove_failure(self.__class__.__name__, item)
+                if output is False:
+                    return False
+                if isinstance(item, self.CHECKPOINT_TYPES):
+                    self.save_checkpoint(item)
+                return True
+
+        return False
+
     def process_meet(self, meet):
         """Process the specified meet"""
 
-        self.process_collection(meet.races, self.process_race)
+        is_complete = self.process_collection(meet.races, self.process_race)
+        self.provider.flush()
+
+        return is_complete
 
     def process_race(self, race):
         """Process the specified race"""
 
-        self.process_collection(race.runners, self.process_runner)
+        return self.process_collection(race.runners, self.process_runner)
 
     def process_runner(self, runner):
         """Process the specified runner"""
 
         if runner.horse is not None:
-            log_time('processing {horse}'.format(horse=runner.horse), self.process_horse, runner.horse)
+            log_time('processing {0}', self.process_horse, runner.horse)
 
         if runner.jockey is not None:
-            log_time('processing {jockey}'.format(jockey=runner.jockey), self.process_jockey, runner.jockey)
+            log_time('processing {0}', self.process_jockey, runner.jockey)
 
         if runner.trainer is not None:
-            log_time('processing {trainer}'.format(trainer=runner.trainer), self.process_trainer, runner.trainer)
+            log_time('processing {0}', self.process_trainer, runner.trainer)
 
     def process_horse(self, horse):
         """Process the specified horse"""
@@ -191,3 +543,143 @@ class Command:
         """Process the specified trainer"""
 
         pass
+
+    async def run_blocking(self, target, *target_args):
+        """Call the blocking target in the blocking executor"""
+
+        pages = dict()
+        while True:
+            try:
+                return await self.event_loop.run_in_executor(self.blocking_executor, self.provider.scraper.http_client.serve, pages, self.profile, target, *target_args)
+            except PageNotFetchedError as error:
+                pages[error.url] = await self.http_client.fetch(error.url)
+
+    async def process_collection_async(self, collection, target):
+        """Concurrently process all items in collection via target"""
+
+        tasks = dict()
+        is_complete = True
+
+        for item in collection:
+            tasks[asyncio.ensure_future(self.process_item_async(target, item), loop=self.event_loop)] = item
+            while len(tasks) >= self.worker_pool.max_workers:
+                is_complete = await self.complete_tasks(tasks) and is_complete
+
+        while len(tasks) > 0:
+            is_complete = await self.complete_tasks(tasks) and is_complete
+
+        return is_complete
+
+    async def complete_tasks(self, tasks):
+        """Wait for and remove the next completed tasks"""
+
+        completed_tasks, pending_tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        is_complete = True
+
+        for task in completed_tasks:
+            item = tasks.pop(task)
+            if task.exception() is not None:
+                logging.critical('An exception occurred while processing {item}'.format(item=item))
+                if len(tasks) > 0:
+                    await asyncio.wait(tasks)
+                raise task.exception()
+            is_complete = task.result() and is_complete
+
+        return is_complete
+
+    async def process_item_async(self, target, item):
+        """Process item via the target coroutine with retries"""
+
+        if isinstance(item, self.CHECKPOINT_TYPES) and await self.run_blocking(self.has_checkpoint, item):
+            logging.debug('Skipping {item}, which has already been processed'.format(item=item))
+            return True
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                output = await target(item)
+
+            except Exception:
+                if attempt < self.max_retries:
+                    logging.warning('Retrying {item} after an exception occurred:\n{error}'.format(item=item, error=traceback.format_exc()))
+                    await asyncio.sleep(self.RETRY_DELAY * (2 ** attempt))
+                else:
+                    logging.critical('An exception occurred while processing {item}:\n{error}'.format(item=item, error=traceback.format_exc()))
+                    await self.run_blocking(self.provider.save_failure, self.__class__.__name__, item, traceback.format_exc())
+
+            else:
+                if self.do_resume:
+                    await self.run_blocking(self.provider.remove_failure, self.__class__.__name__, item)
+                if output is False:
+                    return False
+                if isinstance(item, self.CHECKPOINT_TYPES):
+                    await self.run_blocking(self.save_checkpoint, item)
+                return True
+
+        return False
+
+    async def process_dates_async(self, date_from, date_to):
+        """Process all racing data for the specified date range as coroutines"""
+
+        for date in dates(date_from, date_to):
+            await self.process_date_async(date)
+
+    async def process_date_async(self, date):
+        """Process all racing data for the specified date as coroutines"""
+
+        if not self.do_resume and await self.run_blocking(self.has_checkpoint, date):
+            logging.info('Skipping date {date:%Y-%m-%d}, which has already been processed'.format(date=date))
+            return
+
+        try:
+            if self.do_resume:
+                is_complete = await self.resume_date_async(date)
+            else:
+                meets = await self.run_blocking(self.provider.get_meets_by_date, date)
+                is_complete = await self.process_collection_async(meets, self.process_meet_async)
+            if is_complete:
+                await self.run_blocking(self.save_checkpoint, date)
+            await self.run_blocking(self.provider.flush)
+
+        except BaseException:
+            logging.critical('An exception occurred while processing date {date:%Y-%m-%d}'.format(date=date))
+            if self.do_database_backups:
+                await self.run_blocking(log_time, 'restoring database from backup', self.restore_database)
+            raise
+
+        else:
+            if self.do_database_backups:
+                await self.run_blocking(log_time, 'backing up the database', self.backup_database)
+
+    async def resume_date_async(self, date):
+        """Reprocess the failed items for the specified date as coroutines"""
+
+        if len(await self.run_blocking(self.provider.find, racing_data.Meet, {'date': self.provider.get_meet_date(date)}, None)) < 1:
+            meets = await self.run_blocking(self.provider.get_meets_by_date, date)
+            return await self.process_collection_async(meets, self.process_meet_async)
+
+        is_complete = True
+        for entity_type, target in ((racing_data.Meet, self.process_meet_async), (racing_data.Race, self.process_race_async), (racing_data.Runner, self.process_runner_async)):
+            entities = await self.run_blocking(self.provider.get_failed_entities, self.__class__.__name__, date, entity_type)
+            is_complete = await self.process_collection_async(entities, target) and is_complete
+
+        return is_complete
+
+    async def process_meet_async(self, meet):
+        """Process the specified meet as a coroutine"""
+
+        races = await self.run_blocking(getattr, meet, 'races')
+        is_complete = await self.process_collection_async(races, self.process_race_async)
+        await self.run_blocking(self.provider.flush)
+
+        return is_complete
+
+    async def process_race_async(self, race):
+        """Process the specified race as a coroutine"""
+
+        runners = await self.run_blocking(getattr, race, 'runners')
+        return await self.process_collection_async(runners, self.process_runner_async)
+
+    async def process_runner_async(self, runner):
+        """Process the specified runner as a coroutine"""
+
+        await self.run_blocking(log_time, 'processing {0}', self.process_runner, runner)
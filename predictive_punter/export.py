@@ -0,0 +1,24 @@
+import sys
+
+from . import Command
+
+
+class ExportCommand(Command):
+    """Command line utility to export samples for a specified date range to NumPy files"""
+
+    def __init__(self, *args, **kwargs):
+
+        super().__init__(*args, **kwargs)
+
+        self.export_path = kwargs['export_path']
+
+    def process_dates(self, date_from, date_to):
+        """Export the samples for the specified date range"""
+
+        self.provider.export_samples(date_from, date_to, self.export_path)
+
+
+def main():
+    """Main entry point for export_samples console script"""
+
+    ExportCommand.main(sys.argv[1:])
@@ -0,0 +1,84 @@
+import os
+
+import numpy
+
+
+class FeatureStore:
+    """Provide zero-copy read access to exported samples"""
+
+    COLUMN_NAMES = ('normalized_query_data', 'regression_result', 'classification_result', 'weight', 'sample_ids', 'runner_ids', 'race_ids', 'dates')
+
+    INDEX_NAMES = ('runner_index_ids', 'runner_index_rows', 'race_index_ids', 'race_index_offsets')
+
+    @classmethod
+    def build_indexes(cls, path):
+        """Build the runner and race lookup indexes for the columns exported to the specified path"""
+
+        runner_ids = numpy.load(os.path.join(path, 'runner_ids.npy'), mmap_mode='r')
+        runner_index_rows = numpy.argsort(runner_ids, kind='mergesort')
+        numpy.save(os.path.join(path, 'runner_index_ids.npy'), runner_ids[runner_index_rows])
+        numpy.save(os.path.join(path, 'runner_index_rows.npy'), runner_index_rows)
+
+        race_ids = numpy.load(os.path.join(path, 'race_ids.npy'), mmap_mode='r')
+        race_starts = numpy.flatnonzero(numpy.concatenate(([True], race_ids[1:] != race_ids[:-1]))) if len(race_ids) > 0 else numpy.zeros(0, dtype=numpy.int64)
+        race_stops = numpy.append(race_starts[1:], len(race_ids)) if len(race_starts) > 0 else race_starts
+        race_offsets = numpy.stack((race_starts, race_stops), axis=1)
+        race_order = numpy.argsort(race_ids[race_starts], kind='mergesort')
+        numpy.save(os.path.join(path, 'race_index_ids.npy'), race_ids[race_starts][race_order])
+        numpy.save(os.path.join(path, 'race_index_offsets.npy'), race_offsets[race_order])
+
+    def __init__(self, path):
+
+        self.path = path
+        self.columns = dict([(name, numpy.load(os.path.join(path, name + '.npy'), mmap_mode='r')) for name in self.COLUMN_NAMES + self.INDEX_NAMES])
+
+    def __len__(self):
+
+        return len(self.columns['sample_ids'])
+
+    def get_column(self, name, rows=slice(None)):
+        """Return the specified rows from the named column"""
+
+        return self.columns[name][rows]
+
+    def get_row_by_runner(self, runner_id):
+        """Return the row index for the specified runner ID, or None if not exported"""
+
+        key = str(runner_id).encode()
+        position = numpy.searchsorted(self.columns['runner_index_ids'], key)
+        if position < len(self.columns['runner_index_ids']) and self.columns['runner_index_ids'][position] == key:
+            return int(self.columns['runner_index_rows'][position])
+
+    def get_rows_by_race(self, race_id):
+        """Return a slice covering the rows for all samples in the race with the specified ID"""
+
+        key = str(race_id).encode()
+        position = numpy.searchsorted(self.columns['race_index_ids'], key)
+        if position < len(self.columns['race_index_ids']) and self.columns['race_index_ids'][position] == key:
+            start, stop = self.columns['race_index_offsets'][position]
+            return slice(int(start), int(stop))
+        return slice(0, 0)
+
+    def get_rows_by_dates(self, date_from, date_to):
+        """Return a slice covering the rows for all samples in the specified (inclusive) date range"""
+
+        date_from, date_to = [numpy.datetime64(date.strftime('%Y-%m-%d')) for date in sorted((date_from, date_to))]
+
+        return slice(int(numpy.searchsorted(self.columns['dates'], date_from, 'left')), int(numpy.searchsorted(self.columns['dates'], date_to, 'right')))
+
+    def get_features_by_runner(self, runner_id, name='normalized_query_data'):
+        """Return a view of the named column for the sample associated with the specified runner ID"""
+
+        row = self.get_row_by_runner(runner_id)
+        if row is not None:
+            return self.get_column(name, row)
+
+    def get_features_by_race(self, race_id, name='normalized_query_data'):
+        """Return a view of the named column for all samples in the race with the specified ID"""
+
+        return self.get_column(name, self.get_rows_by_race(race_id))
+
+    def get_features_by_dates(self, date_from, date_to, name='normalized_query_data'):
+        """Return a view of the named column for all samples in the specified (inclusive) date range"""
+
+        return self.get_column(name, self.get_rows_by_dates(date_from, date_to))
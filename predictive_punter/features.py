@@ -0,0 +1,380 @@
+from datetime import datetime, timedelta
+import hashlib
+import json
+import math
+import struct
+
+from bson.binary import Binary
+import numpy
+import pytz
+from racing_data.constants import BARRIER_WIDTH, HORSE_WEIGHT, METRES_PER_LENGTH
+
+from . import __version__
+
+
+EPOCH = datetime(1970, 1, 1, tzinfo=pytz.utc)
+
+ONE_SECOND = timedelta(seconds=1)
+
+SECONDS_PER_DAY = 86400
+
+RUNNER_KEYS = ('barrier', 'number', 'weight')
+
+RUNNER_PROPERTIES = ('age', 'carrying', 'races_per_year', 'spell', 'up')
+
+PERFORMANCE_LISTS = ('at_distance', 'at_distance_on_track', 'at_up', 'career', 'last_10', 'last_12_months', 'on_firm', 'on_good', 'on_heavy', 'on_soft', 'on_synthetic', 'on_track', 'on_turf', 'since_rest', 'with_jockey')
+
+PERFORMANCE_LIST_STATISTICS = ('earnings', 'earnings_potential', 'fourth_pct', 'result_potential', 'roi', 'second_pct', 'starts', 'third_pct', 'win_pct')
+
+TRACK_CONDITIONS = ('FIRM', 'GOOD', 'HEAVY', 'SOFT', 'SYNTHETIC')
+
+QUERY_DATA_KEYS = ('raw_query_data', 'imputed_query_data', 'normalized_query_data')
+
+# Packed query data is stored as a user defined BSON binary subtype, with a header containing the little endian NumPy dtype string and the number of values
+QUERY_DATA_SUBTYPE = 128
+
+QUERY_DATA_HEADER = struct.Struct('<3sI')
+
+
+# Increment the version of a feature group whenever the calculation of its columns changes, so that only those columns are recalculated for existing samples
+FEATURE_GROUP_VERSIONS = {
+}
+
+
+class FeatureGroup:
+    """A named, versioned set of query data columns"""
+
+    def __init__(self, name, column_names, version=1, extract=None):
+
+        self.name = name
+        self.column_names = tuple(column_names)
+        self.version = version
+        self.extract = extract
+
+    def __eq__(self, other):
+
+        return isinstance(other, FeatureGroup) and (self.name, self.version, self.column_names) == (other.name, other.version, other.column_names)
+
+    def __len__(self):
+
+        return len(self.column_names)
+
+
+class FeatureSchema:
+    """The ordered feature groups that make up a sample's query data"""
+
+    def __init__(self, groups):
+
+        self.groups = []
+        self.column_names = ()
+        self.group_slices = dict()
+
+        for group in groups:
+            self.register(group)
+
+    def __len__(self):
+
+        return len(self.column_names)
+
+    @classmethod
+    def from_document(cls, document):
+        """Return a new feature schema from a document created by to_document"""
+
+        return cls([FeatureGroup(group['name'], group['column_names'], group['version']) for group in document['groups']])
+
+    def create_matrix(self, row_count):
+        """Return a new matrix with one row of missing values for each of the specified number of samples"""
+
+        return numpy.full((row_count, len(self)), numpy.nan)
+
+    def create_row(self):
+        """Return a new row of missing values for a single sample"""
+
+        return numpy.full(len(self), numpy.nan)
+
+    def get_changed_groups(self, other_schema):
+        """Return the feature groups that differ from those in other_schema"""
+
+        return [group for group in self.groups if other_schema is None or group.name not in other_schema.group_slices or other_schema.get_group(group.name) != group]
+
+    def get_group(self, name):
+        """Return the feature group with the specified name"""
+
+        return self.groups[[group.name for group in self.groups].index(name)]
+
+    def index(self, column_name):
+        """Return the index of the column with the specified name"""
+
+        return self.column_indexes[column_name]
+
+    def migrate(self, other_schema, values, row=None):
+        """Rearrange the specified values from other_schema into this schema"""
+
+        changed_group_names = set([group.name for group in self.get_changed_groups(other_schema)])
+
+        migrated_values = []
+        for group in self.groups:
+            if group.name in changed_group_names:
+                migrated_values.extend(to_query_data(row[self.group_slices[group.name]]) if row is not None else [None] * len(group))
+            else:
+                migrated_values.extend(values[other_schema.group_slices[group.name]])
+
+        return migrated_values
+
+    def register(self, group):
+        """Append the specified feature group to this schema"""
+
+        if group.name in self.group_slices:
+            raise ValueError('A feature group named {name} has already been registered'.format(name=group.name))
+
+        self.group_slices[group.name] = slice(len(self.column_names), len(self.column_names) + len(group))
+        self.groups.append(group)
+        self.column_names += group.column_names
+        self.column_indexes = dict([(column_name, index) for index, column_name in enumerate(self.column_names)])
+
+        # The schema version combines the predictor's major version with a digest of the feature groups, so that each distinct layout can be recorded and migrated
+        digest = hashlib.sha1(json.dumps([[group.name, group.version, group.column_names] for group in self.groups]).encode('utf-8')).hexdigest()[:12]
+        self.version = '{major_version}.{digest}'.format(major_version=__version__.split('.')[0], digest=digest)
+
+    def to_document(self):
+        """Return a document describing the feature groups in this schema for storage in the database"""
+
+        return {
+            '_id':      self.version,
+            'groups':   [{'name': group.name, 'version': group.version, 'column_names': list(group.column_names)} for group in self.groups]
+        }
+
+
+def generate_feature_groups(versions=FEATURE_GROUP_VERSIONS):
+    """Generate the feature groups calculated by extract_features"""
+
+    for key in RUNNER_KEYS + RUNNER_PROPERTIES:
+        yield FeatureGroup(key, [key], versions.get(key, 1))
+
+    for performance_list in PERFORMANCE_LISTS:
+
+        name = performance_list + '.expected_times'
+        yield FeatureGroup(name, ['{performance_list}.expected_time_{suffix}'.format(performance_list=performance_list, suffix=suffix) for suffix in ('min', 'max', 'mean')], versions.get(name, 1))
+
+        for statistic in PERFORMANCE_LIST_STATISTICS:
+            name = '{performance_list}.{statistic}'.format(performance_list=performance_list, statistic=statistic)
+            yield FeatureGroup(name, [name], versions.get(name, 1))
+
+        name = performance_list + '.starting_prices'
+        yield FeatureGroup(name, ['{performance_list}.starting_price_{suffix}'.format(performance_list=performance_list, suffix=suffix) for suffix in ('min', 'max', 'mean')], versions.get(name, 1))
+
+
+FEATURE_SCHEMA = FeatureSchema(generate_feature_groups())
+
+# Samples generated before feature schemas were recorded contain the original feature groups, all at their first version
+LEGACY_FEATURE_SCHEMA = FeatureSchema(generate_feature_groups(dict()))
+
+CORE_COLUMN_COUNT = len(LEGACY_FEATURE_SCHEMA)
+
+
+def register_feature_group(name, column_names, extract, version=1):
+    """Register a new feature group calculated by calling extract with a runner"""
+
+    FEATURE_SCHEMA.register(FeatureGroup(name, column_names, version, extract))
+
+
+def get_timestamp(date):
+    """Return the UNIX timestamp of the specified datetime"""
+
+    return (date - EPOCH) // ONE_SECOND
+
+
+def match_values(values, predicate):
+    """Return a mask of the values that are not None and satisfy predicate"""
+
+    return numpy.array([value is not None and predicate(value) for value in values], dtype=bool)
+
+
+def sum_selected(values, selected):
+    """Return the sum of the selected values along the last axis"""
+
+    if values.shape[-1] > 0:
+        return numpy.add.accumulate(numpy.where(selected, values, 0.0), axis=-1)[..., -1]
+    else:
+        return numpy.zeros(selected.shape[:-1])
+
+
+class CareerArrays:
+    """Columnar arrays of the values for a runner's career performances, from most to least recent"""
+
+    VALUE_KEYS = ('distance', 'barrier', 'lengths', 'carried', 'winning_time', 'result', 'starters', 'starting_price', 'prize_money', 'prize_pool')
+
+    def __init__(self, runner, meet):
+
+        meet_date = meet['date']
+        career = sorted([performance for performance in runner.horse.performances if performance['date'] < meet_date], key=lambda performance: performance['date'], reverse=True)
+        self.count = len(career)
+
+        self.dates = numpy.array([get_timestamp(performance['date']) for performance in career], dtype=numpy.int64)
+        self.tracks = [performance['track'] for performance in career]
+        self.track_conditions = [performance['track_condition'] for performance in career]
+        self.jockey_urls = [performance['jockey_url'] for performance in career]
+
+        distances, barriers, lengths, carried, winning_times, self.results, starters, self.starting_prices, prize_monies, prize_pools = numpy.array([[performance[key] for key in self.VALUE_KEYS] for performance in career], dtype=float).reshape(self.count, len(self.VALUE_KEYS)).T
+        self.distances = distances
+
+        momentums = (carried + HORSE_WEIGHT) * ((numpy.sqrt((distances ** 2) + ((barriers * BARRIER_WIDTH) ** 2)) - (lengths * METRES_PER_LENGTH)) / winning_times)
+        profits = numpy.where(self.results == 1, -1.00 + self.starting_prices, -1.00)
+
+        # Values summed or summarized for each performance list, stacked so that all lists and values can be reduced at once
+        self.values = numpy.vstack((momentums, self.starting_prices, prize_monies, prize_pools, self.results, starters, profits))
+
+        # The previous performance for each performance is the most recent one on an earlier date, i.e. the first one after all those on the same date
+        earlier_counts = numpy.searchsorted(self.dates[::-1], self.dates, side='left')
+        self.has_previous = earlier_counts > 0
+        previous_indexes = numpy.where(self.has_previous, self.count - earlier_counts, 0)
+
+        self.spells = numpy.where(self.has_previous, (self.dates - self.dates[previous_indexes]) // SECONDS_PER_DAY, 0)
+
+        self.ups = numpy.ones(self.count, dtype=numpy.int64)
+        for index in range(self.count - 1, -1, -1):
+            if self.has_previous[index] and self.spells[index] < 90:
+                self.ups[index] = self.ups[previous_indexes[index]] + 1
+
+
+def create_performance_list_masks(runner, race, meet, career, spell, up):
+    """Return a mask of the runner's career performances in each performance list"""
+
+    at_distance = (career.distances > race['distance'] - 100) & (career.distances < race['distance'] + 100)
+    on_track = numpy.array([track == meet['track'] for track in career.tracks], dtype=bool)
+
+    since_rest = numpy.zeros(career.count, dtype=bool)
+    if spell is not None and spell < 90:
+        for index in range(career.count):
+            since_rest[index] = True
+            if not career.has_previous[index] or career.spells[index] >= 90:
+                break
+
+    masks = {
+        'at_distance':          at_distance,
+        'at_distance_on_track': at_distance & on_track,
+        'at_up':                career.ups == up,
+        'career':               numpy.ones(career.count, dtype=bool),
+        'last_10':              numpy.arange(career.count) < 10,
+        'last_12_months':       career.dates >= get_timestamp(meet['date'] - timedelta(days=365)),
+        'on_track':             on_track,
+        'on_turf':              match_values(career.track_conditions, lambda track_condition: 'SYNTHETIC' not in track_condition),
+        'since_rest':           since_rest,
+        'with_jockey':          numpy.array([jockey_url == runner['jockey_url'] for jockey_url in career.jockey_urls], dtype=bool)
+    }
+    for track_condition in TRACK_CONDITIONS:
+        masks['on_' + track_condition.lower()] = match_values(career.track_conditions, lambda value, track_condition=track_condition: track_condition in value)
+
+    return numpy.array([masks[performance_list] for performance_list in PERFORMANCE_LISTS], dtype=bool).reshape(len(PERFORMANCE_LISTS), career.count)
+
+
+def calculate_statistics(career, masks, actual_distance, actual_weight):
+    """Return the statistics for each performance list selected by masks"""
+
+    statistics = numpy.full((len(masks), 3 + len(PERFORMANCE_LIST_STATISTICS) + 3), numpy.nan)
+
+    selected = masks[:, numpy.newaxis, :] & ~numpy.isnan(career.values)
+    counts = selected.sum(axis=-1)
+    sums = sum_selected(career.values, selected)
+    starts = masks.sum(axis=-1)
+
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+
+        # Minimum, maximum and average momentums and starting prices
+        for offset, value_index in ((0, 0), (len(statistics[0]) - 3, 1)):
+            has_values = counts[:, value_index] > 0
+            statistics[:, offset] = numpy.where(has_values, numpy.where(selected[:, value_index], career.values[value_index], numpy.inf).min(axis=-1, initial=numpy.inf), numpy.nan)
+            statistics[:, offset + 1] = numpy.where(has_values, numpy.where(selected[:, value_index], career.values[value_index], -numpy.inf).max(axis=-1, initial=-numpy.inf), numpy.nan)
+            statistics[:, offset + 2] = numpy.where(has_values, sums[:, value_index] / counts[:, value_index], numpy.nan)
+
+        if actual_distance is not None:
+            statistics[:, 0:3] = actual_distance / (statistics[:, 0:3] / actual_weight)
+        else:
+            statistics[:, 0:3] = numpy.nan
+
+        earnings = numpy.where(counts[:, 2] > 0, sums[:, 2], 0.00)
+        placings = (masks[:, numpy.newaxis, :] & (career.results == numpy.array([[1], [2], [3], [4]]))).sum(axis=-1)
+
+        columns = {
+            'earnings':             earnings,
+            'earnings_potential':   numpy.where((counts[:, 3] > 0) & (sums[:, 3] != 0), earnings / sums[:, 3], numpy.nan),
+            'fourth_pct':           numpy.where(starts > 0, placings[:, 3] / starts, numpy.nan),
+            'result_potential':     numpy.where((counts[:, 4] > 0) & (counts[:, 5] > 0) & (sums[:, 5] != 0), 1.0 - (sums[:, 4] / sums[:, 5]), numpy.nan),
+            'roi':                  numpy.where(starts > 0, sum_selected(career.values[6], masks) / starts, numpy.nan),
+            'second_pct':           numpy.where(starts > 0, placings[:, 1] / starts, numpy.nan),
+            'starts':               starts,
+            'third_pct':            numpy.where(starts > 0, placings[:, 2] / starts, numpy.nan),
+            'win_pct':              numpy.where(starts > 0, placings[:, 0] / starts, numpy.nan)
+        }
+        for index, statistic in enumerate(PERFORMANCE_LIST_STATISTICS):
+            statistics[:, 3 + index] = columns[statistic]
+
+    return statistics
+
+
+def extract_features(runner, row, schema=FEATURE_SCHEMA, groups=None):
+    """Fill the specified row with the query data for the specified runner"""
+
+    if groups is None:
+        groups = schema.groups
+
+    if len([group for group in groups if group.extract is None]) > 0:
+
+        race = runner.race
+        meet = race.meet
+        career = CareerArrays(runner, meet)
+
+        age = runner.age
+        races_per_year = career.count / age if age is not None and age > 0 else None
+        spell = int((get_timestamp(meet['date']) - career.dates[0]) // SECONDS_PER_DAY) if career.count > 0 else None
+        up = 1 if spell is None or spell >= 90 else int(career.ups[0]) + 1
+
+        runner_values = [runner[key] for key in RUNNER_KEYS] + [age, runner.carrying, races_per_year, spell, up]
+        row[:len(runner_values)] = [numpy.nan if value is None else value for value in runner_values]
+
+        masks = create_performance_list_masks(runner, race, meet, career, spell, up)
+        row[len(runner_values):CORE_COLUMN_COUNT] = calculate_statistics(career, masks, runner.actual_distance, runner.actual_weight).ravel()
+
+    for group in groups:
+        if group.extract is not None:
+            row[schema.group_slices[group.name]] = [numpy.nan if value is None else value for value in group.extract(runner)]
+
+    return row
+
+
+def extract_race_features(runners, schema=FEATURE_SCHEMA, groups=None):
+    """Return a matrix of query data for the specified runners"""
+
+    matrix = schema.create_matrix(len(runners))
+    for index, runner in enumerate(runners):
+        extract_features(runner, matrix[index], schema, groups)
+
+    return matrix
+
+
+def to_query_data(row):
+    """Return the specified row of query data as a list"""
+
+    return [None if math.isnan(value) else value for value in row.tolist()]
+
+
+def pack_query_data(query_data, dtype):
+    """Pack the specified query data into a BSON binary value"""
+
+    values = numpy.asarray(numpy.array(query_data, dtype=float), dtype=numpy.dtype(dtype).newbyteorder('<'))
+
+    return Binary(QUERY_DATA_HEADER.pack(values.dtype.str.encode('ascii'), len(values)) + values.tobytes(), QUERY_DATA_SUBTYPE)
+
+
+def unpack_query_data(packed_query_data):
+    """Return a NumPy array of the specified packed query data"""
+
+    dtype, length = QUERY_DATA_HEADER.unpack_from(packed_query_data)
+
+    return numpy.frombuffer(packed_query_data, dtype=numpy.dtype(dtype.decode('ascii')), count=length, offset=QUERY_DATA_HEADER.size)
+
+
+def is_packed_query_data(value):
+    """Return True if the specified value is query data packed by pack_query_data"""
+
+    return isinstance(value, Binary) and value.subtype == QUERY_DATA_SUBTYPE
@@ -0,0 +1,524 @@
+import asyncio
+from collections import OrderedDict
+from datetime import date, timedelta
+import gzip
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from urllib.parse import urlparse
+
+import cache_requests
+import redis
+import requests
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.util.retry import Retry
+
+from .profiling_utils import metrics
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+def create_http_client(redis_uri, pool_size, max_retries=3, backoff_factor=0.5, max_concurrency=None, rate_limit=None, cache_size=256, async_http_client=None, instrument=False):
+    """Return a pooled, retrying and caching HTTP client for the scraper"""
+
+    try:
+        session = cache_requests.Session(connection=redis.fromurl(redis_uri))
+    except BaseException:
+        try:
+            session = cache_requests.Session()
+        except BaseException:
+            session = requests.Session()
+
+    cache_connection = None
+    if isinstance(session, cache_requests.Session):
+        session.cache.all = False
+        cache_connection = session.cache.connection
+
+    if async_http_client is not None:
+        http_client = async_http_client
+
+    else:
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=Retry(total=max_retries, backoff_factor=backoff_factor, status_forcelist=RETRY_STATUS_CODES, raise_on_status=False))
+        for prefix in ('http://', 'https://'):
+            session.mount(prefix, adapter)
+
+        http_client = session
+
+    # Only requests that reach the network are instrumented, not cache hits
+    if instrument:
+        http_client = InstrumentedHTTPClient(http_client)
+
+    if async_http_client is None and max_concurrency is not None:
+        http_client = BoundedHTTPClient(http_client, max_concurrency)
+
+    if rate_limit is not None:
+        http_client = RateLimitedHTTPClient(http_client, rate_limit)
+
+    return TieredCacheHTTPClient(http_client, cache_connection, cache_size)
+
+
+class PageNotFetchedError(Exception):
+    """Raised by a FetchedPageHTTPClient when a page is requested before it has been fetched"""
+
+    def __init__(self, url):
+
+        super().__init__('The page at {url} has not been fetched yet'.format(url=url))
+
+        self.url = url
+
+
+class AsyncHTTPClient:
+    """Send requests via an aiohttp session on an asyncio event loop"""
+
+    def __init__(self, event_loop, max_concurrency=None, max_retries=3, backoff_factor=0.5):
+
+        if aiohttp is None:
+            raise ImportError('The aiohttp package is required to use AsyncHTTPClient')
+
+        self.event_loop = event_loop
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.semaphore = None
+        self.session = None
+
+    def close(self):
+        """Close the aiohttp session if it has been opened"""
+
+        if self.session is not None:
+            self.event_loop.run_until_complete(self.session.close())
+            self.session = None
+
+    async def fetch(self, url):
+        """Fetch the specified URL, retrying failed requests"""
+
+        if self.session is None:
+            self.session = aiohttp.ClientSession()
+        if self.semaphore is None and self.max_concurrency is not None:
+            self.semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        for attempt in range(self.max_retries + 1):
+
+            delay = self.backoff_factor * (2 ** attempt)
+
+            if self.semaphore is not None:
+                await self.semaphore.acquire()
+            try:
+                async with self.session.get(url) as response:
+                    if response.status not in RETRY_STATUS_CODES or attempt >= self.max_retries:
+                        return HTTPResponse(str(response.url), response.status, await response.text())
+                    if response.headers.get('Retry-After', '').isdigit():
+                        delay = float(response.headers['Retry-After'])
+
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                if attempt >= self.max_retries:
+                    raise
+
+            finally:
+                if self.semaphore is not None:
+                    self.semaphore.release()
+
+            await asyncio.sleep(delay)
+
+    def get(self, url, *args, **kwargs):
+        """Send a GET request via the event loop and wait for the response"""
+
+        return asyncio.run_coroutine_threadsafe(self.fetch(url), self.event_loop).result()
+
+
+class FetchedPageHTTPClient:
+    """Serve pages fetched by coroutines to a scraper in another thread"""
+
+    def __init__(self):
+
+        self.local = threading.local()
+
+    def serve(self, pages, target, *target_args):
+        """Call target, serving the specified pages to it"""
+
+        self.local.pages = pages
+        try:
+            return target(*target_args)
+        finally:
+            self.local.pages = None
+
+    def get(self, url, *args, **kwargs):
+        """Return the fetched response for the specified URL"""
+
+        pages = getattr(self.local, 'pages', None)
+        if pages is None or url not in pages:
+            raise PageNotFetchedError(url)
+
+        return pages[url]
+
+
+class BoundedHTTPClient:
+    """Wrap an HTTP client to limit the number of requests in flight at any one time"""
+
+    def __init__(self, http_client, max_concurrency):
+
+        self.http_client = http_client
+        self.semaphore = threading.BoundedSemaphore(max_concurrency)
+
+    def get(self, url, *args, **kwargs):
+        """Send a GET request via the wrapped HTTP client once a request slot is available"""
+
+        with self.semaphore:
+            return self.http_client.get(url, *args, **kwargs)
+
+
+class TokenBucket:
+    """Allow up to rate actions per second on average, with bursts of up to capacity actions"""
+
+    def __init__(self, rate, capacity=None):
+
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self):
+        """Take a token, or return the number of seconds to wait for one"""
+
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+
+            if self.tokens >= 1.0:
+                self.tokens -= 1.0
+                return 0.0
+
+            return (1.0 - self.tokens) / self.rate
+
+    def acquire(self):
+        """Take a token from the bucket, waiting until one is available if necessary"""
+
+        delay = self.take()
+        while delay > 0.0:
+            time.sleep(delay)
+            delay = self.take()
+
+    async def acquire_async(self):
+        """Take a token from the bucket, awaiting one without blocking the event loop if necessary"""
+
+        delay = self.take()
+        while delay > 0.0:
+            await asyncio.sleep(delay)
+            delay = self.take()
+
+
+class RateLimitedHTTPClient:
+    """Wrap an HTTP client to limit the rate of requests to each host"""
+
+    def __init__(self, http_client, rate, capacity=None):
+
+        self.http_client = http_client
+        self.rate = rate
+        self.capacity = capacity
+        self.buckets = dict()
+        self.lock = threading.Lock()
+
+    def get_bucket(self, host):
+        """Get the token bucket for the specified host"""
+
+        with self.lock:
+            if host not in self.buckets:
+                self.buckets[host] = TokenBucket(self.rate, self.capacity)
+            return self.buckets[host]
+
+    def get(self, url, *args, **kwargs):
+        """Send a GET request via the wrapped HTTP client once the host's rate limit allows it"""
+
+        self.get_bucket(urlparse(url).netloc).acquire()
+        return self.http_client.get(url, *args, **kwargs)
+
+    async def fetch(self, url):
+        """Fetch the specified URL once the host's rate limit allows it"""
+
+        await self.get_bucket(urlparse(url).netloc).acquire_async()
+        return await self.http_client.fetch(url)
+
+
+class InstrumentedHTTPClient:
+    """Wrap an HTTP client to record the duration and count of all requests"""
+
+    def __init__(self, http_client):
+
+        self.http_client = http_client
+
+    def get(self, url, *args, **kwargs):
+        """Send a GET request via the wrapped HTTP client and record its duration"""
+
+        with metrics.timer('http.fetch'):
+            response = self.http_client.get(url, *args, **kwargs)
+
+        metrics.increment('http.status.{status_code}'.format(status_code=response.status_code))
+
+        return response
+
+    async def fetch(self, url):
+        """Fetch the specified URL via the wrapped asynchronous HTTP client and record its duration"""
+
+        with metrics.timer('http.fetch'):
+            response = await self.http_client.fetch(url)
+
+        metrics.increment('http.status.{status_code}'.format(status_code=response.status_code))
+
+        return response
+
+
+class CaptureHTTPClient:
+    """Record HTTP responses to a capture store or replay them from it"""
+
+    RECORD = 'record'
+    REPLAY = 'replay'
+
+    def __init__(self, http_client, capture_path, mode=RECORD):
+
+        if mode not in (self.RECORD, self.REPLAY):
+            raise ValueError('Unknown capture mode {mode}'.format(mode=mode))
+
+        self.http_client = http_client
+        self.capture_path = capture_path
+        self.mode = mode
+
+        self.lock = threading.Lock()
+        self.index = dict()
+
+        os.makedirs(os.path.join(self.capture_path, 'objects'), exist_ok=True)
+
+        if os.path.exists(self.index_path):
+            with open(self.index_path, 'r') as index_file:
+                for line in index_file:
+                    if len(line.strip()) > 0:
+                        entry = json.loads(line)
+                        self.index[entry['url']] = entry
+
+    @property
+    def index_path(self):
+        """Return the path to the URL index file"""
+
+        return os.path.join(self.capture_path, 'index.jsonl')
+
+    def get_object_path(self, content_hash):
+        """Return the path to the compressed object with the specified content hash"""
+
+        return os.path.join(self.capture_path, 'objects', content_hash[:2], content_hash + '.gz')
+
+    def get(self, url, *args, **kwargs):
+        """Replay or record the response for the specified URL"""
+
+        if self.mode == self.REPLAY:
+            return self.replay(url)
+
+        response = self.http_client.get(url, *args, **kwargs)
+        self.record(url, response)
+        return response
+
+    async def fetch(self, url):
+        """Replay or record the response for the specified URL"""
+
+        if self.mode == self.REPLAY:
+            return self.replay(url)
+
+        response = await self.http_client.fetch(url)
+        self.record(url, response)
+        return response
+
+    def record(self, url, response):
+        """Store the body of the specified response and add it to the index for url"""
+
+        content = response.text.encode('utf-8')
+        content_hash = hashlib.sha256(content).hexdigest()
+
+        object_path = self.get_object_path(content_hash)
+        if not os.path.exists(object_path):
+            os.makedirs(os.path.dirname(object_path), exist_ok=True)
+            file_descriptor, temp_path = tempfile.mkstemp(dir=os.path.dirname(object_path))
+            with os.fdopen(file_descriptor, 'wb') as object_file:
+                object_file.write(gzip.compress(content))
+            os.replace(temp_path, object_path)
+
+        entry = {'url': url, 'response_url': str(response.url), 'status_code': response.status_code, 'content_hash': content_hash}
+        with self.lock:
+            with open(self.index_path, 'a') as index_file:
+                index_file.write(json.dumps(entry, sort_keys=True) + '\n')
+            self.index[url] = entry
+
+    def replay(self, url):
+        """Return the recorded response for the specified URL"""
+
+        with self.lock:
+            entry = self.index.get(url)
+        if entry is None:
+            raise requests.ConnectionError('No response has been captured for url: {url}'.format(url=url))
+
+        with open(self.get_object_path(entry['content_hash']), 'rb') as object_file:
+            text = gzip.decompress(object_file.read()).decode('utf-8')
+
+        return HTTPResponse(entry['response_url'], entry['status_code'], text)
+
+
+class TieredCacheHTTPClient:
+    """Cache responses from an HTTP client in an LRU cache and redis"""
+
+    DATE_PATTERN = re.compile(r'(\d{4})-(\d{1,2})-(\d{1,2})')
+
+    TTL_POLICY = (
+        ('/racing-results/', 5 * 60),
+        ('/form-guide/', 5 * 60),
+        ('/(horses|jockeys|trainers)/', 24 * 60 * 60)
+    )
+
+    def __init__(self, http_client, cache_connection=None, max_size=256, ttl_policy=TTL_POLICY, default_ttl=60 * 60, historical_ttl=None, key_prefix='predictive_punter:http:'):
+
+        self.http_client = http_client
+        self.cache_connection = cache_connection
+        self.max_size = max_size
+        self.ttl_policy = [(re.compile(pattern), ttl) for pattern, ttl in ttl_policy]
+        self.default_ttl = default_ttl
+        self.historical_ttl = historical_ttl
+        self.key_prefix = key_prefix
+
+        self.lock = threading.Lock()
+        self.lru_cache = OrderedDict()
+
+    def get(self, url, *args, **kwargs):
+        """Get the specified URL from the cache or the wrapped HTTP client"""
+
+        response = self.get_from_lru_cache(url)
+        if response is not None:
+            metrics.increment('http.cache.lru_hit')
+            return response
+
+        ttl = self.get_ttl(url)
+
+        response = self.get_from_redis_cache(url)
+        if response is not None:
+            metrics.increment('http.cache.redis_hit')
+            self.put_in_lru_cache(url, response, ttl)
+            return response
+
+        metrics.increment('http.cache.miss')
+        response = self.http_client.get(url, *args, **kwargs)
+        if response.status_code < 400:
+            response = HTTPResponse(str(response.url), response.status_code, response.text)
+            self.put_in_redis_cache(url, response, ttl)
+            self.put_in_lru_cache(url, response, ttl)
+
+        return response
+
+    async def fetch(self, url):
+        """Fetch the specified URL from the cache or the wrapped HTTP client"""
+
+        response = self.get_from_lru_cache(url)
+        if response is not None:
+            metrics.increment('http.cache.lru_hit')
+            return response
+
+        ttl = self.get_ttl(url)
+        event_loop = asyncio.get_event_loop()
+
+        if self.cache_connection is not None:
+            response = await event_loop.run_in_executor(None, self.get_from_redis_cache, url)
+            if response is not None:
+                metrics.increment('http.cache.redis_hit')
+                self.put_in_lru_cache(url, response, ttl)
+                return response
+
+        metrics.increment('http.cache.miss')
+        response = await self.http_client.fetch(url)
+        if response.status_code < 400:
+            if self.cache_connection is not None:
+                await event_loop.run_in_executor(None, self.put_in_redis_cache, url, response, ttl)
+            self.put_in_lru_cache(url, response, ttl)
+
+        return response
+
+    def get_ttl(self, url):
+        """Return the TTL for the specified URL, or None if it never expires"""
+
+        match = self.DATE_PATTERN.search(url)
+        if match is not None:
+            try:
+                if date(*[int(group) for group in match.groups()]) < date.today() - timedelta(days=1):
+                    return self.historical_ttl
+            except ValueError:
+                pass
+
+        for pattern, ttl in self.ttl_policy:
+            if pattern.search(url) is not None:
+                return ttl
+
+        return self.default_ttl
+
+    def get_from_lru_cache(self, url):
+        """Return the response for the specified URL from the LRU cache"""
+
+        with self.lock:
+            if url in self.lru_cache:
+                expires_at, response = self.lru_cache[url]
+                if expires_at is None or expires_at > time.monotonic():
+                    self.lru_cache.move_to_end(url)
+                    return response
+                del self.lru_cache[url]
+
+    def put_in_lru_cache(self, url, response, ttl):
+        """Add the response for the specified URL to the LRU cache"""
+
+        if self.max_size > 0:
+            with self.lock:
+                self.lru_cache[url] = (time.monotonic() + ttl if ttl is not None else None, response)
+                self.lru_cache.move_to_end(url)
+                while len(self.lru_cache) > self.max_size:
+                    self.lru_cache.popitem(last=False)
+
+    def get_from_redis_cache(self, url):
+        """Return the response for the specified URL from the redis cache, or None if it is not available"""
+
+        if self.cache_connection is not None:
+            try:
+                value = self.cache_connection.get(self.key_prefix + url)
+            except redis.RedisError:
+                metrics.increment('http.cache.redis_error')
+            else:
+                if value is not None:
+                    values = json.loads(value.decode('utf-8') if isinstance(value, bytes) else value)
+                    return HTTPResponse(values['url'], values['status_code'], values['text'])
+
+    def put_in_redis_cache(self, url, response, ttl):
+        """Add the response for the specified URL to the redis cache with the specified TTL"""
+
+        if self.cache_connection is not None:
+            try:
+                self.cache_connection.set(self.key_prefix + url, json.dumps({'url': response.url, 'status_code': response.status_code, 'text': response.text}), ex=ttl)
+            except redis.RedisError:
+                metrics.increment('http.cache.redis_error')
+
+
+class HTTPResponse:
+    """A minimal requests-compatible response for HTTP clients that are not based on requests"""
+
+    def __init__(self, url, status_code, text):
+
+        self.url = url
+        self.status_code = status_code
+        self.text = text
+
+    def raise_for_status(self):
+        """Raise a requests.HTTPError if the response has an error status code"""
+
+        if self.status_code >= 400:
+            raise requests.HTTPError('{status_code} Error for url: {url}'.format(status_code=self.status_code, url=self.url), response=self)
@@ -0,0 +1,13 @@
+import punters_client
+
+
+class PooledScraper(punters_client.Scraper):
+    """Extend the punters_client Scraper class to leave retries to the HTTP client's connection pool"""
+
+    def get_html(self, url, *args, **kwargs):
+        """Get the root HTML element from the specified URL without retrying failed requests"""
+
+        with self.request_lock:
+            response = self.http_client.get(url)
+            response.raise_for_status()
+            return self.parse_html(response.text)
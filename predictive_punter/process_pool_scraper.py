@@ -0,0 +1,88 @@
+from lxml import html
+import punters_client
+
+from .http_utils import HTTPResponse
+
+
+class PrefetchedHTTPClient:
+    """Serve prefetched pages to a scraper in a worker process"""
+
+    EMPTY_HTML = '<html></html>'
+
+    def __init__(self, pages):
+
+        self.pages = pages
+        self.missing_urls = []
+
+    def get(self, url, *args, **kwargs):
+        """Return the prefetched page for the specified URL"""
+
+        if url in self.pages:
+            return HTTPResponse(url, 200, self.pages[url])
+
+        self.missing_urls.append(url)
+        return HTTPResponse(url, 200, self.EMPTY_HTML)
+
+
+def scrape_in_worker(method_name, pages, local_timezone, *method_args, **method_kwargs):
+    """Call the specified scraper method against the prefetched pages"""
+
+    http_client = PrefetchedHTTPClient(pages)
+    scraper = punters_client.Scraper(http_client, html.fromstring, local_timezone)
+
+    result = getattr(scraper, method_name)(*method_args, **method_kwargs)
+
+    return result, http_client.missing_urls
+
+
+class ProcessPoolScraper(punters_client.Scraper):
+    """Extend the punters_client Scraper class to parse pages in a process pool"""
+
+    def __init__(self, http_client, process_pool, *args, **kwargs):
+
+        super().__init__(http_client, html.fromstring, *args, **kwargs)
+
+        self.process_pool = process_pool
+
+    def scrape_in_process_pool(self, method_name, urls, *method_args, **method_kwargs):
+        """Call the specified scraper method in the process pool"""
+
+        method_args = [dict(arg) if isinstance(arg, dict) else arg for arg in method_args]
+
+        pages = dict()
+        while True:
+
+            for url in urls:
+                if url not in pages:
+                    response = self.http_client.get(url)
+                    response.raise_for_status()
+                    pages[url] = response.text
+
+            result, urls = self.process_pool.submit(scrape_in_worker, method_name, pages, self.local_timezone, *method_args, **method_kwargs).result()
+            if len(urls) < 1:
+                return result
+
+    def scrape_meets(self, date, *args, **kwargs):
+        """Scrape a list of meets occurring on the specified date in the process pool"""
+
+        return self.scrape_in_process_pool('scrape_meets', [], date, *args, **kwargs)
+
+    def scrape_races(self, meet):
+        """Scrape a list of races occurring at the specified meet in the process pool"""
+
+        return self.scrape_in_process_pool('scrape_races', [meet['url']], meet)
+
+    def scrape_runners(self, race):
+        """Scrape a list of runners competing in the specified race in the process pool"""
+
+        return self.scrape_in_process_pool('scrape_runners', [race['url']], race)
+
+    def scrape_profile(self, url):
+        """Scrape a profile from the specified URL in the process pool"""
+
+        return self.scrape_in_process_pool('scrape_profile', [url], url)
+
+    def scrape_performances(self, profile):
+        """Scrape a list of performances associated with the specified profile in the process pool"""
+
+        return self.scrape_in_process_pool('scrape_performances', [profile['url']], profile)
@@ -1,15 +1,318 @@
-from datetime import datetime
+from contextlib import contextmanager
+import cProfile
+from datetime import datetime, timedelta
+import functools
+import json
 import logging
+import pstats
+import random
+import threading
+import time
+
+import numpy
+
+
+class DurationSummary:
+    """Summarize the durations recorded for a single stage in bounded memory"""
+
+    RESERVOIR_SIZE = 1024
+
+    def __init__(self, reservoir_size=RESERVOIR_SIZE):
+
+        self.reservoir_size = reservoir_size
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self.reservoir = []
+
+    def record(self, duration):
+        """Add the specified duration to the summary"""
+
+        self.count += 1
+        self.total += duration
+        self.min = duration if self.min is None else min(self.min, duration)
+        self.max = duration if self.max is None else max(self.max, duration)
+
+        if len(self.reservoir) < self.reservoir_size:
+            self.reservoir.append(duration)
+        else:
+            index = random.randrange(self.count)
+            if index < self.reservoir_size:
+                self.reservoir[index] = duration
+
+    def merge(self, other):
+        """Merge another summary into this one"""
+
+        if other.count < 1:
+            return
+
+        if len(self.reservoir) + len(other.reservoir) <= self.reservoir_size:
+            reservoir = self.reservoir + other.reservoir
+        else:
+            pools = [list(self.reservoir), list(other.reservoir)]
+            reservoir = []
+            while len(reservoir) < self.reservoir_size:
+                index = 0 if random.random() * (self.count + other.count) < self.count else 1
+                if len(pools[index]) < 1:
+                    index = 1 - index
+                reservoir.append(pools[index].pop(random.randrange(len(pools[index]))))
+
+        self.count += other.count
+        self.total += other.total
+        self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = other.max if self.max is None else max(self.max, other.max)
+        self.reservoir = reservoir
+
+    def percentile(self, percentile):
+        """Return the specified percentile of the recorded durations"""
+
+        return float(numpy.percentile(self.reservoir, percentile))
+
+
+class Metrics:
+    """Aggregate durations and counts for each processing stage in memory"""
+
+    PERCENTILES = (50, 90, 99)
+
+    def __init__(self):
+
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.counters = dict()
+        self.durations = dict()
+
+    def increment(self, stage, amount=1):
+        """Increment the counter for the specified stage if metrics are enabled"""
+
+        if self.enabled:
+            with self.lock:
+                self.counters[stage] = self.counters.get(stage, 0) + amount
+
+    def record(self, stage, duration):
+        """Record a duration in seconds for the specified stage if metrics are enabled"""
+
+        if self.enabled:
+            with self.lock:
+                if stage not in self.durations:
+                    self.durations[stage] = DurationSummary()
+                self.durations[stage].record(duration)
+
+    @contextmanager
+    def timer(self, stage):
+        """Record the duration of the enclosed block for the specified stage if metrics are enabled"""
+
+        if not self.enabled:
+            yield
+            return
+
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start_time)
+
+    def pop_state(self):
+        """Return the raw counters and duration summaries recorded so far and clear them"""
+
+        with self.lock:
+            state = {'counters': self.counters, 'durations': self.durations}
+            self.counters = dict()
+            self.durations = dict()
+            return state
+
+    def merge_state(self, state):
+        """Merge raw counters and duration summaries returned by pop_state (e.g. from a worker process)"""
+
+        for stage in state['counters']:
+            self.increment(stage, state['counters'][stage])
+
+        if self.enabled:
+            with self.lock:
+                for stage in state['durations']:
+                    if stage not in self.durations:
+                        self.durations[stage] = DurationSummary()
+                    self.durations[stage].merge(state['durations'][stage])
+
+    def summarize(self):
+        """Return a dictionary of counters and duration statistics for each stage"""
+
+        with self.lock:
+            counters = dict(self.counters)
+            summary = {'counters': counters, 'durations': dict()}
+
+            for stage in self.durations:
+                durations = self.durations[stage]
+                summary['durations'][stage] = {
+                    'count':    durations.count,
+                    'total':    float(durations.total),
+                    'mean':     float(durations.total / durations.count),
+                    'min':      float(durations.min),
+                    'max':      float(durations.max)
+                }
+                for percentile in self.PERCENTILES:
+                    summary['durations'][stage]['p{percentile}'.format(percentile=percentile)] = durations.percentile(percentile)
+
+        return summary
+
+    def to_json(self):
+        """Return a JSON representation of the summarized metrics"""
+
+        return json.dumps(self.summarize(), indent=4, sort_keys=True)
+
+    def to_prometheus(self):
+        """Return a Prometheus text exposition format representation of the summarized metrics"""
+
+        summary = self.summarize()
+
+        lines = ['# TYPE predictive_punter_stage_seconds summary']
+        for stage in sorted(summary['durations']):
+            for percentile in self.PERCENTILES:
+                lines.append('predictive_punter_stage_seconds{{stage="{stage}",quantile="{quantile}"}} {value}'.format(stage=stage, quantile=percentile / 100, value=summary['durations'][stage]['p{percentile}'.format(percentile=percentile)]))
+            lines.append('predictive_punter_stage_seconds_sum{{stage="{stage}"}} {value}'.format(stage=stage, value=summary['durations'][stage]['total']))
+            lines.append('predictive_punter_stage_seconds_count{{stage="{stage}"}} {value}'.format(stage=stage, value=summary['durations'][stage]['count']))
+
+        lines.append('# TYPE predictive_punter_stage_total counter')
+        for stage in sorted(summary['counters']):
+            lines.append('predictive_punter_stage_total{{stage="{stage}"}} {value}'.format(stage=stage, value=summary['counters'][stage]))
+
+        return '\n'.join(lines) + '\n'
+
+    def dump(self, path):
+        """Write the summarized metrics to the specified path"""
+
+        with open(path, 'w') as metrics_file:
+            metrics_file.write(self.to_prometheus() if path.endswith('.prom') else self.to_json())
+
+
+class ProfileStats:
+    """Wrap raw profile statistics for pstats.Stats"""
+
+    def __init__(self, stats):
+
+        self.stats = stats
+
+    def create_stats(self):
+
+        pass
+
+
+class ThreadProfiler:
+    """Profile targets in multiple threads and merge the results"""
+
+    def __init__(self):
+
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.profiles = []
+        self.merged_stats = []
+
+    def profile(self, target, *target_args, **target_kwargs):
+        """Call target under the current thread's profiler"""
+
+        if getattr(self.local, 'is_profiling', False):
+            return target(*target_args, **target_kwargs)
+
+        if getattr(self.local, 'profile', None) is None:
+            self.local.profile = cProfile.Profile()
+            with self.lock:
+                self.profiles.append(self.local.profile)
+
+        self.local.is_profiling = True
+        self.local.profile.enable()
+        try:
+            return target(*target_args, **target_kwargs)
+        finally:
+            self.local.profile.disable()
+            self.local.is_profiling = False
+
+    def get_stats(self):
+        """Return the merged profile statistics for all threads"""
+
+        with self.lock:
+            sources = list(self.profiles) + list(self.merged_stats)
+
+        stats = None
+        for source in sources:
+            if stats is None:
+                stats = pstats.Stats(source)
+            else:
+                stats.add(source)
+
+        return stats
+
+    def merge_stats(self, raw_stats):
+        """Merge raw profile statistics returned by pop_stats (e.g. from a worker process)"""
+
+        if raw_stats is not None:
+            with self.lock:
+                self.merged_stats.append(ProfileStats(raw_stats))
+
+    def pop_stats(self):
+        """Return the raw merged profile statistics for all threads and start profiling afresh"""
+
+        stats = self.get_stats()
+
+        with self.lock:
+            self.profiles = []
+            self.merged_stats = []
+        self.local = threading.local()
+
+        if stats is not None:
+            return stats.stats
+
+    def dump(self, path):
+        """Write the merged profile statistics and a report to path"""
+
+        stats = self.get_stats()
+        if stats is not None:
+
+            stats.dump_stats(path)
+
+            with open(path + '.txt', 'w') as report_file:
+                report_stats = pstats.Stats(path, stream=report_file)
+                report_stats.sort_stats('cumulative').print_stats()
+                report_stats.print_callees()
+
+
+metrics = Metrics()
+
+
+def timed(stage):
+    """Decorate a function to record its duration for the specified stage if metrics are enabled"""
+
+    def decorate(target):
+
+        @functools.wraps(target)
+        def timed_target(*target_args, **target_kwargs):
+            if not metrics.enabled:
+                return target(*target_args, **target_kwargs)
+            with metrics.timer(stage):
+                return target(*target_args, **target_kwargs)
+
+        return timed_target
+
+    return decorate
 
 
 def log_time(message, target, *target_args, **target_kwargs):
+    """Call target, recording and logging its duration"""
 
-    start_time = datetime.now()
-    logging.info('Started {message} at {start_time}'.format(message=message, start_time=start_time))
+    is_logging = logging.getLogger().isEnabledFor(logging.INFO)
+    if not metrics.enabled and not is_logging:
+        return target(*target_args, **target_kwargs)
 
+    if is_logging:
+        message = message.format(*target_args)
+        logging.info('Started {message} at {start_time}'.format(message=message, start_time=datetime.now()))
+
+    start_counter = time.perf_counter()
     output = target(*target_args, **target_kwargs)
+    elapsed_seconds = time.perf_counter() - start_counter
+
+    metrics.record(getattr(target, '__name__', 'unknown'), elapsed_seconds)
 
-    elapsed_time = datetime.now() - start_time
-    logging.info('Finished {message} in {elapsed_time}'.format(message=message, elapsed_time=elapsed_time))
+    if is_logging:
+        logging.info('Finished {message} in {elapsed_time}'.format(message=message, elapsed_time=timedelta(seconds=elapsed_seconds)))
 
     return output
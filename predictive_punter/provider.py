@@ -1,11 +1,58 @@
+from contextlib import ExitStack
+from datetime import datetime
+import logging
+import os
+import threading
+import time
+
+from bson.objectid import ObjectId
+import numpy
+import pymongo
+import pymongo.errors
+import pytz
 import racing_data
 
-from . import Sample
+from . import __version__, FeatureStore, Sample
+from .date_utils import dates
+from .features import FEATURE_SCHEMA, LEGACY_FEATURE_SCHEMA, QUERY_DATA_KEYS, FeatureSchema, extract_features, is_packed_query_data, pack_query_data, to_query_data, unpack_query_data
+from .profiling_utils import timed
 
 
 class Provider(racing_data.Provider):
     """Extend the racing_data Provider class with additional functionality specific to predictive analytics"""
 
+    buffered_entity_types = (Sample,)
+
+    # Entities shared between dates may be created by several worker processes at once, so they are unique on these keys and new ones are saved via upserts
+    unique_keys = {
+        racing_data.Horse:          ('url',),
+        racing_data.Jockey:         ('url',),
+        racing_data.Trainer:        ('url',),
+        racing_data.Performance:    ('horse_url', 'date', 'track')
+    }
+
+    def __init__(self, database, scraper, *args, bulk_write_size=1000, bulk_write_interval=30.0, query_data_dtype=None, journal_changes=False, **kwargs):
+
+        super().__init__(database, scraper, *args, **kwargs)
+
+        self.bulk_write_size = bulk_write_size
+        self.bulk_write_interval = bulk_write_interval
+        self.query_data_dtype = query_data_dtype
+
+        self.write_buffer = dict()
+        self.write_buffer_lock = threading.RLock()
+        self.last_flushed_at = time.monotonic()
+
+        self.journal_changes = journal_changes
+        self.journal = dict()
+        self.journal_lock = threading.Lock()
+
+        self.pending_checkpoints = dict()
+
+        self.feature_schemas = dict()
+        self.feature_schemas_lock = threading.Lock()
+        self.save_feature_schemas()
+
     @property
     def database_indexes(self):
         """Return a dictionary of required database indexes for each entity type"""
@@ -15,8 +62,274 @@ class Provider(racing_data.Provider):
             [('runner_id', 1)]
         ]
 
+        for entity_type in self.unique_keys:
+            database_indexes[entity_type] = [index for index in database_indexes[entity_type] if [key for key, direction in index] != list(self.unique_keys[entity_type])]
+
         return database_indexes
 
+    def create_database_indexes(self):
+        """Extend the create_database_indexes method to include failures and unique indexes"""
+
+        super().create_database_indexes()
+
+        self.database['failures'].create_index([('command', 1), ('entity_type', 1), ('date', 1)])
+
+        for entity_type in self.unique_keys:
+            collection = self.get_database_collection(entity_type)
+            keys = list(self.unique_keys[entity_type])
+
+            indexes = [index for index in collection.index_information().values() if [key for key, direction in index['key']] == keys]
+            if any(index.get('unique', False) for index in indexes):
+                continue
+
+            self.remove_duplicates(entity_type)
+
+            # MongoDB does not allow two indexes on the same keys, so the non-unique index created by an earlier version is dropped first and recreated if the unique index cannot be created
+            for index in indexes:
+                collection.drop_index(index['key'])
+            try:
+                collection.create_index([(key, 1) for key in keys], unique=True)
+            except pymongo.errors.OperationFailure:
+                logging.warning('Unable to create a unique index on {keys} for the {collection} collection, so a non-unique index was created instead'.format(keys=', '.join(keys), collection=collection.name))
+                collection.create_index([(key, 1) for key in keys])
+
+    def remove_duplicates(self, entity_type):
+        """Remove duplicate documents of the specified entity type"""
+
+        collection = self.get_database_collection(entity_type)
+
+        duplicates = collection.aggregate([
+            {'$sort': {'updated_at': -1}},
+            {'$group': {'_id': dict((key, '$' + key) for key in self.unique_keys[entity_type]), 'ids': {'$push': '$_id'}, 'count': {'$sum': 1}}},
+            {'$match': {'count': {'$gt': 1}}}
+        ], allowDiskUse=True)
+
+        duplicate_ids = [entity_id for duplicate in duplicates for entity_id in duplicate['ids'][1:]]
+        if len(duplicate_ids) > 0:
+            logging.warning('Removing {count} duplicate documents from the {collection} collection'.format(count=len(duplicate_ids), collection=collection.name))
+            collection.delete_many({'_id': {'$in': duplicate_ids}})
+
+    def record_changes(self, collection_name, entity_ids):
+        """Record the IDs of entities written to the specified collection"""
+
+        if not self.journal_changes:
+            return
+
+        with self.journal_lock:
+            if collection_name not in self.journal:
+                self.journal[collection_name] = set()
+            self.journal[collection_name].update(entity_ids)
+
+    def pop_journal(self):
+        """Return and clear the change journal"""
+
+        with self.journal_lock:
+            journal = self.journal
+            self.journal = dict()
+            return journal
+
+    def decode_query_data(self, query_data):
+        """Return a NumPy array of the specified stored query data"""
+
+        if is_packed_query_data(query_data):
+            return unpack_query_data(query_data)
+        return numpy.array(query_data, dtype=float)
+
+    def encode_entity(self, entity):
+        """Return a document for the specified entity"""
+
+        if not isinstance(entity, Sample):
+            return entity
+
+        document = dict(entity)
+        for key in QUERY_DATA_KEYS:
+            if document.get(key) is not None and not (is_packed_query_data(document[key]) and self.query_data_dtype is not None):
+                if self.query_data_dtype is not None:
+                    document[key] = pack_query_data(entity[key], self.query_data_dtype)
+                else:
+                    document[key] = to_query_data(numpy.array(entity[key], dtype=float))
+
+        return document
+
+    def export_samples(self, date_from, date_to, path, batch_size=1000):
+        """Export the samples for the specified date range to NumPy files"""
+
+        self.flush()
+
+        sample_index = []
+        for date in dates(min(date_from, date_to), max(date_from, date_to)):
+            sample_index.extend(self.get_sample_index_by_date(date))
+
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+        row_count = len(sample_index)
+        column_count = len(FEATURE_SCHEMA)
+
+        def open_column(name, dtype, shape):
+            return numpy.lib.format.open_memmap(os.path.join(path, name + '.npy'), mode='w+', dtype=dtype, shape=shape)
+
+        columns = {
+            'normalized_query_data':    open_column('normalized_query_data', numpy.float64, (row_count, column_count)),
+            'regression_result':        open_column('regression_result', numpy.float64, (row_count,)),
+            'classification_result':    open_column('classification_result', numpy.int64, (row_count,)),
+            'weight':                   open_column('weight', numpy.float64, (row_count,)),
+            'sample_ids':               open_column('sample_ids', 'S24', (row_count,)),
+            'runner_ids':               open_column('runner_ids', 'S24', (row_count,)),
+            'race_ids':                 open_column('race_ids', 'S24', (row_count,)),
+            'dates':                    open_column('dates', 'datetime64[D]', (row_count,))
+        }
+
+        for row, (sample_id, runner_id, race_id, date) in enumerate(sample_index):
+            columns['sample_ids'][row] = str(sample_id)
+            columns['runner_ids'][row] = str(runner_id)
+            columns['race_ids'][row] = str(race_id)
+            columns['dates'][row] = numpy.datetime64(date.strftime('%Y-%m-%d'))
+
+        projection = {'runner_id': 1, 'normalized_query_data': 1, 'regression_result': 1, 'classification_result': 1, 'weight': 1, 'feature_schema_version': 1}
+        for batch_index in range(0, row_count, batch_size):
+
+            rows = dict([(sample_index[row][0], row) for row in range(batch_index, min(batch_index + batch_size, row_count))])
+            upgraded_samples = dict()
+
+            for values in self.get_database_collection(Sample).find({'_id': {'$in': list(rows.keys())}}, projection):
+                row = rows[values['_id']]
+                normalized_query_data = self.decode_query_data(values['normalized_query_data'])
+
+                # Samples generated under an earlier feature schema, or with columns still awaiting recalculation, are brought up to date alongside the other samples in their race
+                if values.get('feature_schema_version') != FEATURE_SCHEMA.version or len(normalized_query_data) != column_count or numpy.isnan(normalized_query_data).any():
+                    race_id = sample_index[row][2]
+                    if race_id not in upgraded_samples:
+                        upgraded_samples[race_id] = self.upgrade_samples_by_race_id(race_id)
+                    values = upgraded_samples[race_id][values['runner_id']]
+                    normalized_query_data = self.decode_query_data(values['normalized_query_data'])
+
+                if len(normalized_query_data) != column_count:
+                    raise ValueError('Sample {sample_id} has {actual} normalized query data values but {expected} were expected'.format(sample_id=values['_id'], actual=len(normalized_query_data), expected=column_count))
+
+                columns['normalized_query_data'][row] = normalized_query_data
+                columns['regression_result'][row] = values['regression_result'] if values['regression_result'] is not None else numpy.nan
+                columns['classification_result'][row] = values['classification_result']
+                columns['weight'][row] = values['weight']
+
+        for column in columns.values():
+            column.flush()
+
+        self.flush()
+
+        FeatureStore.build_indexes(path)
+
+        return row_count
+
+    @timed('mongo.find')
+    def find(self, entity_type, query, property_cache):
+        """Extend the find method to record its duration"""
+
+        return super().find(entity_type, query, property_cache)
+
+    @timed('mongo.find_one')
+    def find_one(self, entity_type, query, property_cache):
+        """Extend the find_one method to include pending writes for buffered entity types"""
+
+        if entity_type in self.buffered_entity_types:
+            with self.write_buffer_lock:
+                for entity in self.write_buffer.values():
+                    if isinstance(entity, entity_type) and all(key in entity and entity[key] == query[key] for key in query):
+                        return entity_type(self, property_cache, entity)
+
+        return super().find_one(entity_type, query, property_cache)
+
+    def find_samples_by_runner_ids(self, runner_ids):
+        """Return the samples for the specified runner IDs by runner ID"""
+
+        samples = dict([(sample['runner_id'], sample) for sample in self.find(Sample, {'runner_id': {'$in': runner_ids}}, None)])
+
+        with self.write_buffer_lock:
+            for entity in self.write_buffer.values():
+                if isinstance(entity, Sample) and entity['runner_id'] in runner_ids:
+                    samples[entity['runner_id']] = Sample(self, None, entity)
+
+        return samples
+
+    def flush(self):
+        """Write all pending entities in the write buffer to the database"""
+
+        with self.write_buffer_lock:
+            entities = list(self.write_buffer.values())
+            self.write_buffer.clear()
+            self.last_flushed_at = time.monotonic()
+
+            if len(entities) > 0:
+                self.write_entities(entities)
+
+            checkpoints = list(self.pending_checkpoints.values())
+            self.pending_checkpoints.clear()
+
+            if len(checkpoints) > 0:
+                self.database['checkpoints'].bulk_write([pymongo.ReplaceOne({'_id': checkpoint['_id']}, checkpoint, upsert=True) for checkpoint in checkpoints], ordered=False)
+                self.record_changes('checkpoints', [checkpoint['_id'] for checkpoint in checkpoints])
+
+    def get_checkpoint(self, command_name, unit, feature_schema_version=None):
+        """Return a checkpoint document for the specified command and unit"""
+
+        if isinstance(unit, datetime):
+            unit_type = 'date'
+            unit_key = self.get_meet_date(unit).isoformat()
+        else:
+            unit_type = unit.__class__.__name__
+            unit_key = str(unit['_id'])
+
+        versions = [__version__] if feature_schema_version is None else [__version__, feature_schema_version]
+
+        return {
+            '_id':                      ':'.join([command_name] + versions + [unit_type, unit_key]),
+            'command':                  command_name,
+            'predictor_version':        __version__,
+            'feature_schema_version':   feature_schema_version,
+            'unit_type':                unit_type,
+            'unit_key':                 unit_key
+        }
+
+    def get_date_by_entity(self, entity):
+        """Return the meet date of the specified entity"""
+
+        if isinstance(entity, racing_data.Runner):
+            entity = entity.race
+        if isinstance(entity, racing_data.Race):
+            entity = entity.meet
+
+        return entity['date']
+
+    def get_failed_entities(self, command_name, date, entity_type):
+        """Get the entities the specified command failed to process on the specified date"""
+
+        entity_ids = [failure['entity_id'] for failure in self.database['failures'].find({'command': command_name, 'entity_type': entity_type.__name__, 'date': self.get_meet_date(date)})]
+        if len(entity_ids) > 0:
+            return self.find(entity_type, {'_id': {'$in': entity_ids}}, None)
+        return []
+
+    def get_feature_schema(self, version):
+        """Return the feature schema with the specified version"""
+
+        schema_id = version if version is not None else 'legacy'
+
+        with self.feature_schemas_lock:
+            if schema_id not in self.feature_schemas:
+                document = self.database['feature_schemas'].find_one({'_id': schema_id})
+                self.feature_schemas[schema_id] = FeatureSchema.from_document(document) if document is not None else None
+            return self.feature_schemas[schema_id]
+
+    def get_meet_date(self, date):
+        """Return the UTC timestamp stored on meets occurring on the specified local date"""
+
+        try:
+            date = self.local_timezone.localize(date)
+        except ValueError:
+            pass
+        date = date.astimezone(self.scraper.SOURCE_TIMEZONE).replace(hour=0, minute=0, second=0, microsecond=0)
+
+        return date.astimezone(pytz.utc)
+
     def get_runner_by_sample(self, sample):
         """Get the runner associated with the specified sample"""
 
@@ -25,4 +338,226 @@ class Provider(racing_data.Provider):
     def get_sample_by_runner(self, runner):
         """Get the sample for the specified runner"""
 
-        return self.find_or_create_one(Sample, {'runner_id': runner['_id']}, {'runner': runner}, runner['updated_at'], Sample.generate_sample, runner)
+        sample = self.find_or_create_one(Sample, {'runner_id': runner['_id']}, {'runner': runner}, runner['updated_at'], Sample.generate_sample, runner)
+        if sample is not None and sample.get('feature_schema_version') != FEATURE_SCHEMA.version:
+            self.upgrade_samples([sample])
+
+        return sample
+
+    def get_sample_index_by_date(self, date):
+        """Get an index of the samples for the specified date, ordered by race"""
+
+        meet_ids = [values['_id'] for values in self.get_database_collection(racing_data.Meet).find({'date': self.get_meet_date(date)}, {'_id': 1})]
+        race_ids = [values['_id'] for values in self.get_database_collection(racing_data.Race).find({'meet_id': {'$in': meet_ids}}, {'_id': 1}).sort('_id', pymongo.ASCENDING)]
+        runner_race_ids = dict([(values['_id'], values['race_id']) for values in self.get_database_collection(racing_data.Runner).find({'race_id': {'$in': race_ids}, 'is_scratched': False}, {'race_id': 1})])
+
+        sample_index = [(values['_id'], values['runner_id'], runner_race_ids[values['runner_id']], date) for values in self.get_database_collection(Sample).find({'runner_id': {'$in': list(runner_race_ids.keys())}, 'normalized_query_data': {'$ne': None}}, {'runner_id': 1})]
+
+        return sorted(sample_index, key=lambda item: (str(item[2]), str(item[1])))
+
+    def get_samples_by_race(self, race):
+        """Get the samples for all active runners in the specified race"""
+
+        runners = dict([(runner['_id'], runner) for runner in race.active_runners if 'sample' not in runner.property_cache])
+        if len(runners) > 0:
+
+            samples = self.find_samples_by_runner_ids(list(runners.keys()))
+            stale_runner_ids = sorted([runner_id for runner_id in runners if self.is_stale_sample(samples.get(runner_id), runners[runner_id])], key=str)
+
+            if len(stale_runner_ids) > 0:
+                with ExitStack() as stack:
+
+                    for runner_id in stale_runner_ids:
+                        stack.enter_context(self.get_query_lock(Sample, {'runner_id': runner_id}))
+
+                    samples.update(self.find_samples_by_runner_ids(stale_runner_ids))
+
+                    stale_runner_ids = [runner_id for runner_id in stale_runner_ids if self.is_stale_sample(samples.get(runner_id), runners[runner_id])]
+                    for runner_id, values in zip(stale_runner_ids, Sample.generate_samples([runners[runner_id] for runner_id in stale_runner_ids])):
+
+                        values['runner_id'] = runner_id
+                        created_sample = Sample(self, None, values)
+
+                        if samples.get(runner_id) is None:
+                            samples[runner_id] = created_sample
+                        else:
+                            for key in created_sample:
+                                if key != 'created_at':
+                                    samples[runner_id][key] = created_sample[key]
+
+                        self.save(samples[runner_id])
+
+            for runner_id in runners:
+                samples[runner_id].property_cache['runner'] = runners[runner_id]
+                runners[runner_id].property_cache['sample'] = samples[runner_id]
+
+            outdated_samples = [samples[runner_id] for runner_id in runners if samples[runner_id].get('feature_schema_version') != FEATURE_SCHEMA.version]
+            if len(outdated_samples) > 0:
+                self.upgrade_samples(outdated_samples)
+
+        return [runner.sample for runner in race.active_runners]
+
+    def prepare_race_samples(self, race):
+        """Impute and normalize the samples for the specified race"""
+
+        return Sample.prepare_samples(race, self.get_samples_by_race(race))
+
+    def upgrade_samples_by_race_id(self, race_id):
+        """Upgrade the samples for the race with the specified ID"""
+
+        race = self.find_one(racing_data.Race, {'_id': race_id}, None)
+
+        return dict([(sample['runner_id'], sample) for sample in self.prepare_race_samples(race)])
+
+    def save_winning_values(self, race):
+        """Persist the winning values on the specified race"""
+
+        if not race.has_winning_values and len([runner for runner in race.active_runners if runner.result is None]) < 1:
+            race['winning_values'] = race.winning_values
+            race['winning_values_updated_at'] = race['updated_at']
+            self.save(race)
+
+    def has_checkpoint(self, command_name, unit, feature_schema_version=None):
+        """Return True if the specified command has completed the specified unit"""
+
+        return self.database['checkpoints'].find_one({'_id': self.get_checkpoint(command_name, unit, feature_schema_version)['_id']}, {'_id': 1}) is not None
+
+    def is_stale_sample(self, sample, runner):
+        """Return True if the specified sample needs to be generated again"""
+
+        return sample is None or sample['updated_at'] < runner['updated_at'] or sample.has_expired
+
+    def remove_failure(self, command_name, entity):
+        """Remove any failure recorded for the specified command and entity"""
+
+        failure = self.database['failures'].find_one_and_delete({'command': command_name, 'entity_type': entity.__class__.__name__, 'entity_id': entity['_id']}, projection={'_id': True})
+        if failure is not None:
+            self.record_changes('failures', [failure['_id']])
+
+    def save_checkpoint(self, command_name, unit, feature_schema_version=None):
+        """Record the completion of the specified unit by the specified command"""
+
+        checkpoint = self.get_checkpoint(command_name, unit, feature_schema_version)
+        checkpoint['completed_at'] = datetime.now(pytz.utc)
+
+        with self.write_buffer_lock:
+            self.pending_checkpoints[checkpoint['_id']] = checkpoint
+
+    def save_failure(self, command_name, entity, error):
+        """Record a failure of the specified command to process the specified entity"""
+
+        failure = self.database['failures'].find_one_and_update({'command': command_name, 'entity_type': entity.__class__.__name__, 'entity_id': entity['_id']}, {
+            '$set': {
+                'date':         self.get_date_by_entity(entity),
+                'description':  str(entity),
+                'error':        error,
+                'failed_at':    datetime.now(pytz.utc)
+            },
+            '$inc': {
+                'failure_count':    1
+            }
+        }, projection={'_id': True}, upsert=True, return_document=pymongo.ReturnDocument.AFTER)
+        self.record_changes('failures', [failure['_id']])
+
+    def save_feature_schemas(self):
+        """Record the current and legacy feature schemas in the database"""
+
+        document = FEATURE_SCHEMA.to_document()
+        self.database['feature_schemas'].update_one({'_id': document.pop('_id')}, {'$set': document}, upsert=True)
+        with self.feature_schemas_lock:
+            self.feature_schemas[FEATURE_SCHEMA.version] = FeatureSchema(FEATURE_SCHEMA.groups)
+
+        document = LEGACY_FEATURE_SCHEMA.to_document()
+        document.pop('_id')
+        self.database['feature_schemas'].update_one({'_id': 'legacy'}, {'$setOnInsert': document}, upsert=True)
+
+    @timed('mongo.save')
+    def save(self, entity):
+        """Extend the save method to add buffered entity types to the write buffer"""
+
+        if isinstance(entity, racing_data.Race) and 'winning_values' in entity and not entity.has_winning_values:
+            # The race has been updated (e.g. re-scraped) since its winning values were persisted, so they may no longer reflect its results
+            del entity['winning_values']
+            entity.pop('winning_values_updated_at', None)
+            entity.property_cache.pop('winning_values', None)
+
+        if isinstance(entity, self.buffered_entity_types):
+            self.save_all([entity])
+        elif entity.__class__ in self.unique_keys and entity.get('_id') is None:
+            self.save_unique(entity)
+        else:
+            super().save(entity)
+            self.record_changes(self.get_database_collection(entity.__class__).name, [entity['_id']])
+
+    def save_all(self, entities):
+        """Save the specified entities in bulk"""
+
+        unbuffered_entities = [entity for entity in entities if not isinstance(entity, self.buffered_entity_types)]
+        if len(unbuffered_entities) > 0:
+            self.write_entities(unbuffered_entities)
+
+        with self.write_buffer_lock:
+
+            for entity in entities:
+                if isinstance(entity, self.buffered_entity_types):
+                    if '_id' not in entity or entity['_id'] is None:
+                        entity['_id'] = ObjectId()
+                    self.write_buffer[entity['_id']] = entity
+
+            if len(self.write_buffer) >= self.bulk_write_size or time.monotonic() - self.last_flushed_at >= self.bulk_write_interval:
+                self.flush()
+
+    def save_unique(self, entity):
+        """Insert the specified new entity via an upsert on its unique keys"""
+
+        collection = self.get_database_collection(entity.__class__)
+        query = dict([(key, entity[key]) for key in self.unique_keys[entity.__class__]])
+        values = dict([(key, entity[key]) for key in entity if key != '_id' and key not in query])
+
+        try:
+            document = collection.find_one_and_update(query, {'$setOnInsert': values}, projection={'_id': 1}, upsert=True, return_document=pymongo.ReturnDocument.AFTER)
+        except pymongo.errors.DuplicateKeyError:
+            document = collection.find_one(query, {'_id': 1})
+
+        entity['_id'] = document['_id']
+        self.record_changes(collection.name, [entity['_id']])
+
+    def upgrade_samples(self, samples):
+        """Recalculate the changed feature groups of the specified samples"""
+
+        for sample in samples:
+
+            schema = self.get_feature_schema(sample.get('feature_schema_version'))
+            row = extract_features(sample.runner, FEATURE_SCHEMA.create_row(), groups=FEATURE_SCHEMA.get_changed_groups(schema))
+
+            sample['raw_query_data'] = FEATURE_SCHEMA.migrate(schema, sample['raw_query_data'], row)
+            for key in ('imputed_query_data', 'normalized_query_data'):
+                if sample[key] is not None:
+                    sample[key] = FEATURE_SCHEMA.migrate(schema, sample[key])
+            sample['feature_schema_version'] = FEATURE_SCHEMA.version
+
+        self.save_all(samples)
+
+    @timed('mongo.bulk_write')
+    def write_entities(self, entities):
+        """Write the specified entities to the database via a single bulk write per collection"""
+
+        entities_by_collection = dict()
+        for entity in entities:
+            collection_name = self.get_database_collection(entity.__class__).name
+            if collection_name not in entities_by_collection:
+                entities_by_collection[collection_name] = []
+            entities_by_collection[collection_name].append(entity)
+
+        for collection_name in entities_by_collection:
+
+            requests = []
+            for entity in entities_by_collection[collection_name]:
+                if '_id' in entity and entity['_id'] is not None:
+                    requests.append(pymongo.ReplaceOne({'_id': entity['_id']}, self.encode_entity(entity), upsert=True))
+                else:
+                    entity.pop('_id', None)
+                    requests.append(pymongo.InsertOne(entity))
+
+            self.database[collection_name].bulk_write(requests, ordered=False)
+            self.record_changes(collection_name, [entity['_id'] for entity in entities_by_collection[collection_name]])
@@ -1,3 +1,5 @@
+import math
+
 import racing_data
 
 
@@ -13,77 +15,151 @@ def active_runners(self):
 racing_data.Race.active_runners = active_runners
 
 
+def get_placings(self, places):
+    """Return the placings and tie counts for the specified number of places"""
+
+    results = []
+    for count in range(places):
+        results.append([])
+
+    for runner in self.active_runners:
+        if runner.result is not None and runner.result <= len(results):
+            results[runner.result - 1].append(runner)
+
+    placings = []
+    for result in results:
+        if len(result) < 1 and len(placings) > 0:
+            placings[-1] = (placings[-1][0], placings[-1][1] + 1)
+        else:
+            placings.append((result, 1))
+
+    return placings
+
+racing_data.Race.get_placings = get_placings
+
+
+def generate_winning_combinations(self, places):
+    """Generate all winning combinations for the specified number of places"""
+
+    placed_runners = []
+    for runners, count in self.get_placings(places):
+        placed_runners.extend([runners] * count)
+
+    if len([runners for runners in placed_runners if len(runners) != 1]) < 1:
+        combination = tuple([runners[0] for runners in placed_runners])
+        if len(set([id(runner) for runner in combination])) == len(combination):
+            yield combination
+        return
+
+    def generate_combinations(index, combination, used_ids):
+
+        if index >= len(placed_runners):
+            yield tuple(combination)
+
+        else:
+            for runner in placed_runners[index]:
+                if id(runner) not in used_ids:
+                    used_ids.add(id(runner))
+                    combination.append(runner)
+                    yield from generate_combinations(index + 1, combination, used_ids)
+                    combination.pop()
+                    used_ids.remove(id(runner))
+
+    yield from generate_combinations(0, [], set())
+
+racing_data.Race.generate_winning_combinations = generate_winning_combinations
+
+
 def get_winning_combinations(self, places):
     """Return a list of tuples of Runners representing all winning combinations for the specified number of places"""
 
     if len(self.runners) >= places:
+        return list(self.generate_winning_combinations(places))
+
+racing_data.Race.get_winning_combinations = get_winning_combinations
 
-        def get_combinations(results):
 
-            if len(results) > 0:
+def calculate_elementary_symmetric_sums(values, count):
+    """Return a list of the sums of the products of all combinations of 0 to count items from values"""
 
-                combinations = []
+    sums = [1.0] + [0.0] * count
+    for value in values:
+        for index in range(count, 0, -1):
+            sums[index] += sums[index - 1] * value
 
-                next_combinations = get_combinations(results[1:])
-                for item in results[0]:
-                    if next_combinations is None:
-                        combinations.append([item])
-                    else:
-                        for next_combination in next_combinations:
-                            combinations.append([item] + next_combination)
+    return sums
 
-                dupes = []
-                for index in range(len(combinations)):
-                    for item in combinations[index]:
-                        if len([combo_item for combo_item in combinations[index] if combo_item == item]) > 1:
-                            dupes.append(index)
-                            break
-                for index in sorted(dupes, reverse=True):
-                    del combinations[index]
 
-                return combinations
+def calculate_values(self, max_places):
+    """Return the winning values for 1 to max_places places"""
 
-        results = []
-        for count in range(places):
-            results.append([])
+    placings = self.get_placings(max_places)
+    placing_sums = [calculate_elementary_symmetric_sums([runner.starting_price if runner.starting_price is not None else 1.00 for runner in runners], count) for runners, count in placings]
 
-        for runner in self.active_runners:
-            if runner.result is not None and runner.result <= len(results):
-                results[runner.result - 1].append(runner)
+    values = []
+    for places in range(1, max_places + 1):
 
-        for index in range(len(results) - 1):
-            if len(results[index + 1]) < 1:
-                results[index + 1] = list(results[index])
+        value = 0.00
 
-        return [tuple(combination) for combination in get_combinations(results)]
+        if len(self.runners) >= places:
 
-racing_data.Race.get_winning_combinations = get_winning_combinations
+            total_product = 1.00
+            total_combinations = 1
+            remaining_places = places
+            for (runners, count), sums in zip(placings, placing_sums):
+                if remaining_places < 1:
+                    break
+                count = min(count, remaining_places)
+                remaining_places -= count
+
+                total_product *= math.factorial(count) * sums[count]
+                total_combinations *= math.factorial(len(runners)) // math.factorial(len(runners) - count) if len(runners) >= count else 0
+
+            value += total_product - total_combinations
+
+        values.append(value)
+
+    return values
+
+racing_data.Race.calculate_values = calculate_values
 
 
 def calculate_value(self, places):
     """Return the value of the winning combinations with the specified number of places for the race"""
 
-    value = 0.00
+    return self.calculate_values(places)[-1]
 
-    combinations = self.get_winning_combinations(places)
-    if combinations is not None:
-        for combination in combinations:
-            combination_value = 1.00
-            for runner in combination:
-                if runner.starting_price is not None:
-                    combination_value *= runner.starting_price
-            value += combination_value - 1.00
+racing_data.Race.calculate_value = calculate_value
 
-    return value
 
-racing_data.Race.calculate_value = calculate_value
+@property
+def has_winning_values(self):
+    """Return True if the persisted winning values are current"""
+
+    return 'winning_values' in self and self.get('winning_values_updated_at') == self['updated_at']
+
+racing_data.Race.has_winning_values = has_winning_values
+
+
+@property
+def winning_values(self):
+    """Return a list of the win, exacta, trifecta and first four values for this race"""
+
+    def generate_winning_values():
+        if self.has_winning_values:
+            return self['winning_values']
+        return self.calculate_values(4)
+
+    return self.get_cached_property('winning_values', generate_winning_values)
+
+racing_data.Race.winning_values = winning_values
 
 
 @property
 def win_value(self):
     """Return the sum of the starting prices of all winning runners less the number of winning runners"""
     
-    return self.calculate_value(1)
+    return self.winning_values[0]
 
 racing_data.Race.win_value = win_value
 
@@ -92,7 +168,7 @@ racing_data.Race.win_value = win_value
 def exacta_value(self):
     """Return the sum of the products of the starting prices of first and second placed runners in all winning combinations, less the number of winning combinations"""
     
-    return self.calculate_value(2)
+    return self.winning_values[1]
 
 racing_data.Race.exacta_value = exacta_value
 
@@ -101,7 +177,7 @@ racing_data.Race.exacta_value = exacta_value
 def trifecta_value(self):
     """Return the sum of the products of the starting prices of first, second and third placed runners in all winning combinations, less the number of winning combinations"""
     
-    return self.calculate_value(3)
+    return self.winning_values[2]
 
 racing_data.Race.trifecta_value = trifecta_value
 
@@ -110,7 +186,7 @@ racing_data.Race.trifecta_value = trifecta_value
 def first_four_value(self):
     """Return the sum of the products of the starting prices of the first, second, third and fourth placed runners in all winning combinations, less the number of winning combinations"""
     
-    return self.calculate_value(4)
+    return self.winning_values[3]
 
 racing_data.Race.first_four_value = first_four_value
 
@@ -1,3 +1,5 @@
+from contextlib import contextmanager
+import math
 import threading
 
 import numpy
@@ -5,74 +7,171 @@ import racing_data
 import sklearn.preprocessing
 
 from . import __version__
+from .features import FEATURE_SCHEMA, QUERY_DATA_KEYS, extract_race_features, is_packed_query_data, to_query_data, unpack_query_data
+from .profiling_utils import metrics, timed
+
+
+class LockRegistry:
+    """Hand out a reference counted re-entrant lock per key"""
+
+    def __init__(self):
+
+        self.lock = threading.Lock()
+        self.locks = dict()
+
+    def __len__(self):
+
+        with self.lock:
+            return len(self.locks)
+
+    @contextmanager
+    def hold(self, key):
+        """Acquire the lock for the specified key for the duration of the enclosed block"""
+
+        with self.lock:
+            if key not in self.locks:
+                self.locks[key] = [threading.RLock(), 0]
+            entry = self.locks[key]
+            entry[1] += 1
+
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self.lock:
+                entry[1] -= 1
+                if entry[1] < 1:
+                    del self.locks[key]
 
 
 class Sample(racing_data.Entity):
     """A sample represents a single row of query data for a predictor"""
 
-    normalizer_locks = dict()
+    normalizer_locks = LockRegistry()
+
+    def __init__(self, provider, property_cache, *args, **kwargs):
+
+        values = dict(*args, **kwargs)
+        packed_values = dict([(key, values.pop(key)) for key in QUERY_DATA_KEYS if is_packed_query_data(values.get(key))])
+
+        super().__init__(provider, property_cache, values)
+
+        # Packed query data is only unpacked when it is first accessed
+        dict.update(self, packed_values)
+
+    def __getitem__(self, key):
+
+        value = super().__getitem__(key)
+
+        if key in QUERY_DATA_KEYS and is_packed_query_data(value):
+            value = unpack_query_data(value)
+            self[key] = value
+
+        return value
 
     @classmethod
     def generate_sample(cls, runner):
         """Generate a new sample for the specified runner"""
 
-        raw_query_data = []
-        for key in ('barrier', 'number', 'weight'):
-            raw_query_data.append(runner[key])
-        for key in ('age', 'carrying', 'races_per_year', 'spell', 'up'):
-            raw_query_data.append(getattr(runner, key))
-        for key1 in ('at_distance', 'at_distance_on_track', 'at_up', 'career', 'last_10', 'last_12_months', 'on_firm', 'on_good', 'on_heavy', 'on_soft', 'on_synthetic', 'on_track', 'on_turf', 'since_rest', 'with_jockey'):
-            raw_query_data.extend(runner.calculate_expected_times(key1))
-            performance_list = getattr(runner, key1)
-            for key2 in ('earnings', 'earnings_potential', 'fourth_pct', 'result_potential', 'roi', 'second_pct', 'starts', 'third_pct', 'win_pct'):
-                raw_query_data.append(getattr(performance_list, key2))
-            raw_query_data.extend(performance_list.starting_prices)
-
-        regression_result = None
-        if runner.result is not None:
-            all_results = [runner.result] + [other_runner.result for other_runner in runner.race.active_runners if other_runner['_id'] != runner['_id'] and other_runner.result is not None]
-            try:
-                regression_result = sklearn.preprocessing.normalize(numpy.array(all_results).reshape(1,-1))[0,0]
-            except BaseException:
-                pass
-
-        return {
-            'raw_query_data':           raw_query_data,
-            'imputed_query_data':       None,
-            'normalized_query_data':    None,
-            'regression_result':        regression_result,
-            'classification_result':    runner.result if runner.result is not None and 1 <= runner.result <= 4 else 5,
-            'weight':                   runner.race.total_value,
-            'predictor_version':        __version__
-        }
+        return cls.generate_samples([runner])[0]
+
+    @classmethod
+    @timed('sample.generate')
+    def generate_samples(cls, runners):
+        """Generate new samples for the specified runners"""
+
+        query_data = extract_race_features(runners)
+        race_results = dict()
+
+        samples = []
+        for runner, row in zip(runners, query_data):
+
+            regression_result = None
+            if runner.result is not None:
+
+                # Normalize the runner's result against the results of all other active runners in the race, summing the squared results only once per race
+                race = runner.race
+                if id(race) not in race_results:
+                    active_results = dict([(other_runner['_id'], other_runner.result) for other_runner in race.active_runners if other_runner.result is not None])
+                    race_results[id(race)] = active_results, sum([result ** 2 for result in active_results.values()])
+                active_results, squared_results = race_results[id(race)]
+
+                try:
+                    norm = math.sqrt(squared_results - (active_results[runner['_id']] ** 2 if runner['_id'] in active_results else 0) + (runner.result ** 2))
+                    regression_result = runner.result / norm if norm != 0 else float(runner.result)
+                except BaseException:
+                    pass
+
+            samples.append({
+                'raw_query_data':           to_query_data(row),
+                'imputed_query_data':       None,
+                'normalized_query_data':    None,
+                'regression_result':        regression_result,
+                'classification_result':    runner.result if runner.result is not None and 1 <= runner.result <= 4 else 5,
+                'weight':                   runner.race.total_value,
+                'predictor_version':        __version__,
+                'feature_schema_version':   FEATURE_SCHEMA.version
+            })
+
+        return samples
 
     @classmethod
     def get_normalizer_lock(cls, race):
-        """Get the normalizer lock for the specified race"""
+        """Get a context manager holding the normalizer lock for the specified race"""
 
-        if race['_id'] not in cls.normalizer_locks:
-            cls.normalizer_locks[race['_id']] = threading.RLock()
+        return cls.normalizer_locks.hold(race['_id'])
 
-        return cls.normalizer_locks[race['_id']]
+    @staticmethod
+    def has_missing_values(query_data):
+        """Return True if the specified query data needs recalculation"""
 
-    @property
-    def imputed_query_data(self):
-        """Impute the raw query data alongside the raw query data for all other active runners in the race"""
+        return query_data is None or bool(numpy.isnan(numpy.array(query_data, dtype=float)).any())
+
+    @staticmethod
+    def fill_missing_values(query_data, values):
+        """Fill the missing values in the specified query data"""
+
+        if query_data is None:
+            return values.tolist()
+
+        query_data = numpy.array(query_data, dtype=float)
+        return numpy.where(numpy.isnan(query_data), values, query_data).tolist()
+
+    @classmethod
+    def prepare_samples(cls, race, samples):
+        """Impute and normalize the query data for the specified samples from race in a single batch"""
 
-        if self['imputed_query_data'] is None:
+        with cls.get_normalizer_lock(race):
 
-            all_query_data = [list(self['raw_query_data'])] + [runner.sample['raw_query_data'] for runner in self.runner.race.active_runners if runner['_id'] != self.runner['_id']]
+            pending_samples = [sample for sample in samples if cls.has_missing_values(sample['imputed_query_data']) or cls.has_missing_values(sample['normalized_query_data'])]
+            if len(pending_samples) > 0:
 
-            for index in range(len(all_query_data[0])):
-                if all_query_data[0][index] is None:
-                    other_values = [value[index] for value in all_query_data[1:] if value[index] is not None]
-                    if len(other_values) > 0:
-                        all_query_data[0][index] = sum(other_values) / len(other_values)
-                    else:
-                        all_query_data[0][index] = 0.0
+                with metrics.timer('sample.impute'):
+                    raw_query_data = numpy.array([numpy.array(sample['raw_query_data'], dtype=float) for sample in samples])
+                    value_counts = numpy.sum(~numpy.isnan(raw_query_data), axis=0)
+                    column_means = numpy.where(value_counts > 0, numpy.nansum(raw_query_data, axis=0) / numpy.maximum(value_counts, 1), 0.0)
 
-            self['imputed_query_data'] = all_query_data[0]
-            self.provider.save(self)
+                    imputed_query_data = numpy.where(numpy.isnan(raw_query_data), column_means, raw_query_data)
+                    for index, sample in enumerate(samples):
+                        if cls.has_missing_values(sample['imputed_query_data']):
+                            sample['imputed_query_data'] = cls.fill_missing_values(sample['imputed_query_data'], imputed_query_data[index])
+
+                with metrics.timer('sample.normalize'):
+                    normalized_query_data = sklearn.preprocessing.normalize(numpy.array([numpy.array(sample['imputed_query_data'], dtype=float) for sample in samples]), axis=0)
+                    for index, sample in enumerate(samples):
+                        if cls.has_missing_values(sample['normalized_query_data']):
+                            sample['normalized_query_data'] = cls.fill_missing_values(sample['normalized_query_data'], normalized_query_data[index])
+
+                samples[0].provider.save_all(pending_samples)
+
+        return samples
+
+    @property
+    def imputed_query_data(self):
+        """Impute the raw query data alongside the raw query data for all other active runners in the race"""
+
+        if self.has_missing_values(self['imputed_query_data']):
+            self.prepare_race_samples()
 
         return self['imputed_query_data']
 
@@ -80,21 +179,23 @@ class Sample(racing_data.Entity):
     def normalized_query_data(self):
         """Normalize the imputed query data alongside the imputed query data for all other active runners in the race"""
 
-        with self.get_normalizer_lock(self.runner.race):
+        if self.has_missing_values(self['normalized_query_data']):
+            self.prepare_race_samples()
+
+        return self['normalized_query_data']
 
-            if self['normalized_query_data'] is None:
-                
-                all_query_data = numpy.asarray([self.imputed_query_data] + [runner.sample.imputed_query_data for runner in self.runner.race.active_runners if runner['_id'] != self.runner['_id']])
-                self['normalized_query_data'] = sklearn.preprocessing.normalize(all_query_data, axis=0).tolist()[0]
-                self.provider.save(self)
+    def prepare_race_samples(self):
+        """Impute and normalize the query data for this sample"""
 
-            return self['normalized_query_data']
+        race = self.runner.race
+        self.provider.get_samples_by_race(race)
+        self.prepare_samples(race, [self] + [runner.sample for runner in race.active_runners if runner['_id'] != self.runner['_id']])
 
     @property
     def has_expired(self):
-        """Expire samples sourced from an incompatible predictor version"""
+        """Expire samples sourced from an incompatible predictor version or an unknown feature schema"""
 
-        return self['predictor_version'].split('.')[0] != __version__.split('.')[0]
+        return self['predictor_version'].split('.')[0] != __version__.split('.')[0] or self.provider.get_feature_schema(self.get('feature_schema_version')) is None
 
     @property
     def runner(self):
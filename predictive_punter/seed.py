@@ -1,18 +1,80 @@
 import sys
 
+import racing_data
+
 from . import Command
+from .features import FEATURE_SCHEMA
 
 
 class SeedCommand(Command):
     """Command line utility to pre-seed query data for all active runners in a specified date range"""
-    
-    def process_runner(self, runner):
-        """Extend the process_runner method to generate a sample if necessary"""
 
-        super().process_runner(runner)
+    @property
+    def feature_schema_version(self):
+        """Return the version of the current feature schema"""
+
+        return FEATURE_SCHEMA.version
+
+    def process_race(self, race):
+        """Extend the process_race method to prepare the race's samples"""
+
+        is_complete = super().process_race(race)
+
+        if is_complete:
+            self.prepare_race(race)
+
+        return is_complete
+
+    async def process_race_async(self, race):
+        """Extend the process_race_async method to prepare the race's samples"""
+
+        is_complete = await super().process_race_async(race)
+
+        if is_complete:
+            await self.run_blocking(self.prepare_race, race)
+
+        return is_complete
+
+    def prepare_race(self, race):
+        """Prepare the samples and winning values for the specified race"""
+
+        self.provider.prepare_race_samples(race)
+        self.provider.save_winning_values(race)
+
+    def get_failed_runner_races(self, date):
+        """Return the races of the runners that this command failed to process on the specified date"""
+
+        races = dict()
+        for runner in self.provider.get_failed_entities(self.__class__.__name__, date, racing_data.Runner):
+            races[runner['race_id']] = runner.race
+
+        return list(races.values())
+
+    def resume_date(self, date):
+        """Extend the resume_date method to prepare the races of failed runners"""
+
+        races = self.get_failed_runner_races(date)
+        is_complete = super().resume_date(date)
+
+        failed_race_ids = [runner['race_id'] for runner in self.provider.get_failed_entities(self.__class__.__name__, date, racing_data.Runner)]
+        for race in races:
+            if race['_id'] not in failed_race_ids:
+                self.prepare_race(race)
+
+        return is_complete
+
+    async def resume_date_async(self, date):
+        """Extend the resume_date_async method to prepare the races of failed runners"""
+
+        races = await self.run_blocking(self.get_failed_runner_races, date)
+        is_complete = await super().resume_date_async(date)
+
+        failed_race_ids = [runner['race_id'] for runner in await self.run_blocking(self.provider.get_failed_entities, self.__class__.__name__, date, racing_data.Runner)]
+        for race in races:
+            if race['_id'] not in failed_race_ids:
+                await self.run_blocking(self.prepare_race, race)
 
-        if runner['is_scratched'] == False:
-            runner.sample.normalized_query_data
+        return is_complete
 
 
 def main():
@@ -0,0 +1,50 @@
+import concurrent.futures
+import os
+import threading
+
+
+class WorkerPool(concurrent.futures.Executor):
+    """A bounded pool of worker threads with caller-runs overflow"""
+
+    def __init__(self, max_workers=None, profiler=None):
+
+        if max_workers is None:
+            max_workers = (os.cpu_count() or 1) * 5
+
+        self.max_workers = max_workers
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers)
+        self.idle_workers = threading.BoundedSemaphore(max_workers)
+        self.profiler = profiler
+
+    def run_in_worker(self, target, *target_args, **target_kwargs):
+        """Call target in a worker thread and mark the worker idle again"""
+
+        try:
+            if self.profiler is not None:
+                return self.profiler.profile(target, *target_args, **target_kwargs)
+            return target(*target_args, **target_kwargs)
+        finally:
+            self.idle_workers.release()
+
+    def shutdown(self, wait=True):
+        """Shut down the underlying worker threads"""
+
+        self.executor.shutdown(wait)
+
+    def submit(self, target, *target_args, **target_kwargs):
+        """Submit target to an idle worker, or call it in the current thread"""
+
+        if self.idle_workers.acquire(blocking=False):
+            try:
+                return self.executor.submit(self.run_in_worker, target, *target_args, **target_kwargs)
+            except BaseException:
+                self.idle_workers.release()
+                raise
+
+        future = concurrent.futures.Future()
+        future.set_running_or_notify_cancel()
+        try:
+            future.set_result(target(*target_args, **target_kwargs))
+        except Exception as e:
+            future.set_exception(e)
+        return future
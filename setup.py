@@ -48,6 +48,9 @@ setup(
         'scipy'
     ],
     extras_require={
+        'async':    [
+            'aiohttp'
+        ],
         'dev':  [
             'bumpversion',
             'check-manifest'
@@ -62,6 +65,7 @@ setup(
     data_files=[],
     entry_points={
         'console_scripts':  [
+            'export_samples=predictive_punter.export:main',
             'scrape=predictive_punter.scrape:main',
             'seed=predictive_punter.seed:main'
         ]
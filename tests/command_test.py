@@ -0,0 +1,216 @@
+import asyncio
+import concurrent.futures
+from datetime import datetime
+import threading
+import time
+
+import predictive_punter
+import pytest
+import pytz
+import racing_data
+
+
+@pytest.fixture()
+def command():
+
+    command = predictive_punter.Command.__new__(predictive_punter.Command)
+    command.worker_pool = predictive_punter.WorkerPool(2)
+    command.max_retries = 0
+    command.do_resume = False
+    command.do_force = False
+    yield command
+    command.worker_pool.shutdown()
+
+
+def test_process_collection(command):
+    """The process_collection method should consume generators lazily, never keeping more items in flight than there are workers"""
+
+    lock = threading.Lock()
+    state = {'generated': 0, 'processed': 0, 'max_in_flight': 0}
+
+    def generate_items():
+        for item in range(20):
+            with lock:
+                state['generated'] += 1
+                state['max_in_flight'] = max(state['max_in_flight'], state['generated'] - state['processed'])
+            yield item
+
+    def process_item(item):
+        time.sleep(0.001)
+        with lock:
+            state['processed'] += 1
+
+    command.process_collection(generate_items(), process_item)
+
+    assert state['processed'] == 20
+    assert state['max_in_flight'] <= command.worker_pool.max_workers
+
+
+def test_process_item(command):
+    """The process_item method should retry failed items with exponential backoff, recording a failure only once all attempts fail"""
+
+    class Provider:
+
+        def __init__(self):
+            self.failures = []
+
+        def save_failure(self, command_name, entity, error):
+            self.failures.append((command_name, entity, error))
+
+    command.provider = Provider()
+    command.max_retries = 2
+    command.RETRY_DELAY = 0.001
+    attempts = {'flaky': 0, 'broken': 0}
+
+    def process_item(item):
+        attempts[item] += 1
+        if item == 'broken' or attempts[item] < 2:
+            raise ValueError(item)
+        return item
+
+    command.process_collection(iter(['flaky', 'broken']), process_item)
+
+    assert attempts == {'flaky': 2, 'broken': 3}
+    assert len(command.provider.failures) == 1
+    assert command.provider.failures[0][:2] == ('Command', 'broken')
+    assert 'ValueError: broken' in command.provider.failures[0][2]
+
+
+def test_checkpoints(command):
+    """The process_collection method should skip races that have already been checkpointed unless forced, and checkpoint races once processed"""
+
+    class Provider:
+
+        def __init__(self):
+            self.checkpoints = set([1])
+            self.local_timezone = pytz.utc
+
+        def get_date_by_entity(self, entity):
+            return pytz.utc.localize(datetime(2016, 2, 1))
+
+        def get_meet_by_race(self, race):
+            return meet
+
+        def get_meet_date(self, date):
+            return pytz.utc.localize(date)
+
+        def has_checkpoint(self, command_name, unit, feature_schema_version=None):
+            return unit['_id'] in self.checkpoints
+
+        def save_checkpoint(self, command_name, unit, feature_schema_version=None):
+            self.checkpoints.add(unit['_id'])
+
+    command.provider = Provider()
+    meet = racing_data.Meet(command.provider, None, {'_id': 'meet', 'date': pytz.utc.localize(datetime(2016, 2, 1)), 'track': 'Kilmore'})
+    races = [racing_data.Race(command.provider, {'meet': meet}, _id=race_id, number=race_id) for race_id in (1, 2)]
+    processed_ids = []
+
+    command.process_collection(races, lambda race: processed_ids.append(race['_id']))
+    assert processed_ids == [2]
+    assert command.provider.checkpoints == set([1, 2])
+
+    command.do_force = True
+    command.process_collection(races, lambda race: processed_ids.append(race['_id']))
+    assert sorted(processed_ids) == [1, 2, 2]
+
+
+def test_feature_schema_version(command):
+    """Only the checkpoints of the seed command should depend on the feature schema"""
+
+    seed_command = predictive_punter.SeedCommand.__new__(predictive_punter.SeedCommand)
+
+    assert command.feature_schema_version is None
+    assert seed_command.feature_schema_version == predictive_punter.features.FEATURE_SCHEMA.version
+
+
+def test_incomplete_checkpoints(command):
+    """The process_collection method should not checkpoint races with any runners that could not be processed"""
+
+    class Provider:
+
+        def __init__(self):
+            self.checkpoints = set()
+            self.failures = []
+
+        def get_date_by_entity(self, entity):
+            return pytz.utc.localize(datetime(2016, 2, 1))
+
+        def get_meet_date(self, date):
+            return pytz.utc.localize(date)
+
+        def has_checkpoint(self, command_name, unit, feature_schema_version=None):
+            return unit['_id'] in self.checkpoints
+
+        def save_checkpoint(self, command_name, unit, feature_schema_version=None):
+            self.checkpoints.add(unit['_id'])
+
+        def save_failure(self, command_name, entity, error):
+            self.failures.append(entity)
+
+    def process_runner(runner):
+        if runner == 'broken':
+            raise ValueError(runner)
+
+    command.provider = Provider()
+    races = [racing_data.Race(command.provider, None, _id=race_id, number=race_id, runners=runners) for race_id, runners in ((1, ['runner']), (2, ['runner', 'broken']))]
+
+    assert command.process_collection(races, lambda race: command.process_collection(race['runners'], process_runner)) is False
+    assert command.provider.checkpoints == set([1])
+    assert command.provider.failures == ['broken']
+
+
+def test_process_collection_async(command):
+    """The process_collection_async method should process all items in a generator with no more items in flight than there are workers"""
+
+    command.event_loop = asyncio.new_event_loop()
+    state = {'in_flight': 0, 'max_in_flight': 0, 'processed': []}
+
+    async def process_item(item):
+        state['in_flight'] += 1
+        state['max_in_flight'] = max(state['max_in_flight'], state['in_flight'])
+        await asyncio.sleep(0.001)
+        state['in_flight'] -= 1
+        state['processed'].append(item)
+
+    try:
+        command.event_loop.run_until_complete(command.process_collection_async((item for item in range(10)), process_item))
+    finally:
+        command.event_loop.close()
+
+    assert sorted(state['processed']) == list(range(10))
+    assert state['max_in_flight'] <= command.worker_pool.max_workers
+
+
+def test_run_blocking(command):
+    """The run_blocking method should await the fetch of each page the blocking target requires and call it again until it has all of them"""
+
+    class AsyncHTTPClient:
+
+        def __init__(self):
+            self.urls = []
+
+        async def fetch(self, url):
+            self.urls.append(url)
+            return predictive_punter.http_utils.HTTPResponse(url, 200, url)
+
+    class Provider:
+
+        def __init__(self):
+            self.scraper = predictive_punter.AsyncScraper(lambda text: text)
+
+    command.provider = Provider()
+    command.http_client = AsyncHTTPClient()
+    command.profiler = None
+    command.event_loop = asyncio.new_event_loop()
+    command.blocking_executor = concurrent.futures.ThreadPoolExecutor(1)
+
+    def scrape(*urls):
+        return [command.provider.scraper.get_html(url) for url in urls]
+
+    try:
+        assert command.event_loop.run_until_complete(command.run_blocking(scrape, 'a', 'b', 'a')) == ['a', 'b', 'a']
+    finally:
+        command.blocking_executor.shutdown()
+        command.event_loop.close()
+
+    assert command.http_client.urls == ['a', 'b']
@@ -71,6 +71,21 @@ def sample(provider, runner):
     return provider.get_sample_by_runner(runner)
 
 
+@pytest.fixture(scope='session')
+def export_path(database_uri, tmpdir_factory):
+
+    export_path = str(tmpdir_factory.mktemp('export'))
+    predictive_punter.SeedCommand.main(['-d', database_uri, '2016-2-1', '2016-2-2'])
+    predictive_punter.ExportCommand.main(['-d', database_uri, '-o', export_path, '2016-2-1', '2016-2-2'])
+    return export_path
+
+
+@pytest.fixture(scope='session')
+def feature_store(export_path):
+
+    return predictive_punter.FeatureStore(export_path)
+
+
 @pytest.fixture(scope='session')
 def future_race(provider):
 
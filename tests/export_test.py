@@ -0,0 +1,34 @@
+import os
+
+from bson.objectid import ObjectId
+import numpy
+
+
+def load_column(export_path, name):
+    """Load the specified column from the export path as a memory-mapped array"""
+
+    return numpy.load(os.path.join(export_path, name + '.npy'), mmap_mode='r')
+
+
+def test_row_count(database, export_path):
+    """The export command should export one row for each sample with normalized query data"""
+
+    expected_count = database['samples'].count({'normalized_query_data': {'$ne': None}})
+
+    for name in ('normalized_query_data', 'regression_result', 'classification_result', 'weight', 'sample_ids', 'runner_ids', 'race_ids', 'dates'):
+        assert load_column(export_path, name).shape[0] == expected_count
+
+
+def test_values(database, export_path):
+    """The export command should export the normalized query data, classification result and weight for each sample"""
+
+    sample_ids = load_column(export_path, 'sample_ids')
+    normalized_query_data = load_column(export_path, 'normalized_query_data')
+    classification_result = load_column(export_path, 'classification_result')
+    weight = load_column(export_path, 'weight')
+
+    for row in range(len(sample_ids)):
+        sample = database['samples'].find_one({'_id': ObjectId(sample_ids[row].decode())})
+        assert normalized_query_data[row].tolist() == sample['normalized_query_data']
+        assert classification_result[row] == sample['classification_result']
+        assert weight[row] == sample['weight']
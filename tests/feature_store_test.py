@@ -0,0 +1,34 @@
+from datetime import datetime
+
+import numpy
+
+
+def test_features_by_dates(feature_store):
+    """The get_features_by_dates method should return a view of the normalized query data for all samples in the date range"""
+
+    features = feature_store.get_features_by_dates(datetime(2016, 2, 1), datetime(2016, 2, 1))
+
+    assert numpy.shares_memory(features, feature_store.get_column('normalized_query_data'))
+    assert (feature_store.get_column('dates', feature_store.get_rows_by_dates(datetime(2016, 2, 1), datetime(2016, 2, 1))) == numpy.datetime64('2016-02-01')).all()
+    assert 0 < len(features) < len(feature_store)
+
+
+def test_features_by_race(feature_store, race):
+    """The get_features_by_race method should return a view of the normalized query data for all active runners in the race"""
+
+    features = feature_store.get_features_by_race(race['_id'])
+
+    assert numpy.shares_memory(features, feature_store.get_column('normalized_query_data'))
+    assert len(features) == len(race.active_runners)
+
+
+def test_features_by_runner(feature_store, runner):
+    """The get_features_by_runner method should return the normalized query data for the runner's sample"""
+
+    assert feature_store.get_features_by_runner(runner['_id']).tolist() == runner.sample.normalized_query_data
+
+
+def test_missing_runner(feature_store):
+    """The get_row_by_runner method should return None for runners that have not been exported"""
+
+    assert feature_store.get_row_by_runner('0' * 24) is None
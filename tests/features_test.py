@@ -0,0 +1,101 @@
+import bson
+import numpy
+import predictive_punter.features
+import pytest
+
+
+def test_schema():
+    """The feature schema should name every query data column in the order they are stored, grouped into feature groups"""
+
+    schema = predictive_punter.features.FEATURE_SCHEMA
+
+    assert len(schema) == 8 + 15 * (3 + 9 + 3)
+    assert schema.column_names[:8] == ('barrier', 'number', 'weight', 'age', 'carrying', 'races_per_year', 'spell', 'up')
+    assert schema.index('at_distance.expected_time_min') == 8
+    assert schema.index('with_jockey.starting_price_mean') == len(schema) - 1
+    assert schema.group_slices['with_jockey.expected_times'] == slice(len(schema) - 15, len(schema) - 12)
+    assert schema.group_slices['at_distance.win_pct'] == slice(8 + 11, 8 + 12)
+
+
+def test_schema_version():
+    """The feature schema version should change when the feature groups change"""
+
+    schema = predictive_punter.features.FEATURE_SCHEMA
+
+    assert predictive_punter.features.FeatureSchema(schema.groups).version == schema.version
+    assert predictive_punter.features.FeatureSchema(schema.groups[:-1]).version != schema.version
+    assert predictive_punter.features.FeatureSchema(schema.groups[:-1] + [predictive_punter.features.FeatureGroup(schema.groups[-1].name, schema.groups[-1].column_names, 2)]).version != schema.version
+    assert schema.version.split('.')[0] == predictive_punter.__version__.split('.')[0]
+
+
+def test_changed_groups():
+    """The get_changed_groups method should return the feature groups that are missing from or have a different version in another schema"""
+
+    old_schema = predictive_punter.features.FeatureSchema([predictive_punter.features.FeatureGroup('a', ['a']), predictive_punter.features.FeatureGroup('b', ['b'])])
+    new_schema = predictive_punter.features.FeatureSchema([predictive_punter.features.FeatureGroup('a', ['a']), predictive_punter.features.FeatureGroup('b', ['b'], 2), predictive_punter.features.FeatureGroup('c', ['c1', 'c2'])])
+
+    assert [group.name for group in new_schema.get_changed_groups(old_schema)] == ['b', 'c']
+    assert [group.name for group in new_schema.get_changed_groups(None)] == ['a', 'b', 'c']
+
+
+def test_document():
+    """A feature schema should be recreated with the same version from its document"""
+
+    schema = predictive_punter.features.FEATURE_SCHEMA
+
+    assert predictive_punter.features.FeatureSchema.from_document(schema.to_document()).version == schema.version
+
+
+def test_migrate():
+    """The migrate method should copy the columns of unchanged groups and take the columns of changed groups from the specified row"""
+
+    old_schema = predictive_punter.features.FeatureSchema([predictive_punter.features.FeatureGroup('a', ['a']), predictive_punter.features.FeatureGroup('b', ['b'])])
+    new_schema = predictive_punter.features.FeatureSchema([predictive_punter.features.FeatureGroup('a', ['a']), predictive_punter.features.FeatureGroup('b', ['b'], 2), predictive_punter.features.FeatureGroup('c', ['c1', 'c2'])])
+
+    assert new_schema.migrate(old_schema, [1.0, 2.0], numpy.array([numpy.nan, 3.0, 4.0, numpy.nan])) == [1.0, 3.0, 4.0, None]
+    assert new_schema.migrate(old_schema, [1.0, 2.0]) == [1.0, None, None, None]
+
+
+def test_pack_query_data():
+    """Query data packed into a binary value should be unpacked into an array of the same values with missing values as NaN"""
+
+    for dtype in ('float32', 'float64'):
+
+        packed_query_data = predictive_punter.features.pack_query_data([1.5, None, 3], dtype)
+        assert predictive_punter.features.is_packed_query_data(packed_query_data)
+
+        query_data = predictive_punter.features.unpack_query_data(bson.decode(bson.encode({'query_data': packed_query_data}))['query_data'])
+        assert query_data.dtype == numpy.dtype(dtype)
+        assert predictive_punter.features.to_query_data(query_data) == [1.5, None, 3.0]
+
+
+def test_packed_sample():
+    """Packed query data should only be unpacked when it is first accessed"""
+
+    sample = predictive_punter.Sample(None, None, {'raw_query_data': predictive_punter.features.pack_query_data([1.0, 2.0], 'float32')})
+
+    assert predictive_punter.features.is_packed_query_data(dict.__getitem__(sample, 'raw_query_data'))
+    assert sample['raw_query_data'].tolist() == [1.0, 2.0]
+    assert isinstance(dict.__getitem__(sample, 'raw_query_data'), numpy.ndarray)
+
+
+def test_register():
+    """Registering a feature group should append its columns and change the schema version"""
+
+    schema = predictive_punter.features.FeatureSchema([predictive_punter.features.FeatureGroup('a', ['a'])])
+    version = schema.version
+
+    schema.register(predictive_punter.features.FeatureGroup('b', ['b1', 'b2']))
+
+    assert schema.column_names == ('a', 'b1', 'b2')
+    assert schema.group_slices['b'] == slice(1, 3)
+    assert schema.version != version
+
+    with pytest.raises(ValueError):
+        schema.register(predictive_punter.features.FeatureGroup('a', ['a']))
+
+
+def test_to_query_data():
+    """The to_query_data function should represent missing values as None"""
+
+    assert predictive_punter.features.to_query_data(numpy.array([1.0, numpy.nan, 2.5])) == [1.0, None, 2.5]
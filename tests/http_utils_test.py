@@ -0,0 +1,175 @@
+import asyncio
+from datetime import datetime
+import threading
+import time
+
+from predictive_punter import http_utils
+import pytest
+import requests
+
+
+def test_bounded_http_client():
+    """The BoundedHTTPClient should never allow more than the maximum number of concurrent requests"""
+
+    class HTTPClient:
+
+        def __init__(self):
+            self.active_requests = self.max_active_requests = 0
+            self.lock = threading.Lock()
+
+        def get(self, url):
+            with self.lock:
+                self.active_requests += 1
+                self.max_active_requests = max(self.active_requests, self.max_active_requests)
+            time.sleep(0.01)
+            with self.lock:
+                self.active_requests -= 1
+
+    http_client = HTTPClient()
+    bounded_http_client = http_utils.BoundedHTTPClient(http_client, 2)
+
+    threads = [threading.Thread(target=bounded_http_client.get, args=('https://www.punters.com.au',)) for count in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert http_client.max_active_requests == 2
+
+
+def test_http_response():
+    """The HTTPResponse class should raise a requests.HTTPError for error status codes only"""
+
+    http_utils.HTTPResponse('https://www.punters.com.au', 200, '').raise_for_status()
+
+    with pytest.raises(requests.HTTPError):
+        http_utils.HTTPResponse('https://www.punters.com.au', 404, '').raise_for_status()
+
+
+def test_capture_http_client(tmpdir):
+    """The CaptureHTTPClient should replay recorded responses without using the wrapped HTTP client, storing identical content only once"""
+
+    class HTTPClient:
+
+        def get(self, url):
+            return http_utils.HTTPResponse(url, 200, '<html>{url}</html>'.format(url=url[-1]))
+
+    capture_path = str(tmpdir)
+    recording_client = http_utils.CaptureHTTPClient(HTTPClient(), capture_path)
+    for url in ('https://www.punters.com.au/1', 'https://www.punters.com.au/2', 'https://www.punters.com.au/?1'):
+        recording_client.get(url)
+
+    replaying_client = http_utils.CaptureHTTPClient(None, capture_path, http_utils.CaptureHTTPClient.REPLAY)
+
+    response = replaying_client.get('https://www.punters.com.au/2')
+    assert response.status_code == 200
+    assert response.text == '<html>2</html>'
+    assert len([path for path in tmpdir.join('objects').visit('*.gz')]) == 2
+
+    with pytest.raises(requests.ConnectionError):
+        replaying_client.get('https://www.punters.com.au/3')
+
+
+def test_tiered_cache_http_client():
+    """The TieredCacheHTTPClient should serve repeated requests from its LRU or redis cache tiers with TTLs determined by URL"""
+
+    class HTTPClient:
+
+        def __init__(self):
+            self.urls = []
+
+        def get(self, url):
+            self.urls.append(url)
+            return http_utils.HTTPResponse(url, 404 if 'missing' in url else 200, url)
+
+    class CacheConnection(dict):
+
+        def set(self, name, value, ex=None):
+            self[name] = (value, ex)
+
+        def get(self, name):
+            return dict.get(self, name, (None, None))[0]
+
+    http_client = HTTPClient()
+    cache_connection = CacheConnection()
+    cache_client = http_utils.TieredCacheHTTPClient(http_client, cache_connection, max_size=1)
+
+    for url in ('https://www.punters.com.au/racing-results/2016-02-01/', 'https://www.punters.com.au/horses/horse/', 'https://www.punters.com.au/racing-results/2016-02-01/', 'https://www.punters.com.au/missing/', 'https://www.punters.com.au/missing/'):
+        assert cache_client.get(url).text == url
+
+    assert http_client.urls == ['https://www.punters.com.au/racing-results/2016-02-01/', 'https://www.punters.com.au/horses/horse/', 'https://www.punters.com.au/missing/', 'https://www.punters.com.au/missing/']
+    assert cache_connection['predictive_punter:http:https://www.punters.com.au/racing-results/2016-02-01/'][1] is None
+    assert cache_connection['predictive_punter:http:https://www.punters.com.au/horses/horse/'][1] == 24 * 60 * 60
+    assert cache_client.get_ttl('https://www.punters.com.au/racing-results/{date:%Y-%m-%d}/'.format(date=datetime.now())) == 5 * 60
+
+
+def test_rate_limited_http_client():
+    """The RateLimitedHTTPClient should limit the rate of requests to each host independently"""
+
+    class HTTPClient:
+
+        def get(self, url):
+            return url
+
+    rate_limited_client = http_utils.RateLimitedHTTPClient(HTTPClient(), 20.0, 1.0)
+
+    start_time = time.monotonic()
+    for count in range(5):
+        rate_limited_client.get('https://www.punters.com.au/{count}'.format(count=count))
+        rate_limited_client.get('https://www.example.com/{count}'.format(count=count))
+
+    assert 0.2 - 0.01 <= time.monotonic() - start_time < 0.5
+
+
+def test_create_http_client():
+    """The create_http_client function should mount a connection pool of the specified size that retries server errors"""
+
+    http_client = http_utils.create_http_client('redis://localhost:6379/predictive_punter_test', 12, max_concurrency=4, rate_limit=10.0)
+    session = http_client.http_client.http_client.http_client
+
+    adapter = session.get_adapter('https://www.punters.com.au')
+    assert adapter._pool_maxsize == 12
+    assert 503 in adapter.max_retries.status_forcelist
+
+
+def test_create_instrumented_http_client():
+    """The create_http_client function should instrument only the requests that miss the cache"""
+
+    http_client = http_utils.create_http_client('redis://localhost:6379/predictive_punter_test', 12, instrument=True)
+
+    assert isinstance(http_client, http_utils.TieredCacheHTTPClient)
+    assert isinstance(http_client.http_client, http_utils.InstrumentedHTTPClient)
+
+
+def test_async_fetch():
+    """The fetch methods of the caching and rate limiting HTTP clients should await the wrapped asynchronous HTTP client, and the FetchedPageHTTPClient should serve only fetched pages"""
+
+    class AsyncHTTPClient:
+
+        def __init__(self):
+            self.urls = []
+
+        async def fetch(self, url):
+            self.urls.append(url)
+            return http_utils.HTTPResponse(url, 200, url)
+
+    async_http_client = AsyncHTTPClient()
+    http_client = http_utils.TieredCacheHTTPClient(http_utils.RateLimitedHTTPClient(async_http_client, 100.0), None, max_size=2)
+    url = 'https://www.punters.com.au/horses/horse/'
+
+    event_loop = asyncio.new_event_loop()
+    try:
+        responses = [event_loop.run_until_complete(http_client.fetch(url)) for count in range(2)]
+    finally:
+        event_loop.close()
+
+    assert [response.text for response in responses] == [url, url]
+    assert async_http_client.urls == [url]
+
+    fetched_page_client = http_utils.FetchedPageHTTPClient()
+    assert fetched_page_client.serve({url: responses[0]}, fetched_page_client.get, url) is responses[0]
+
+    with pytest.raises(http_utils.PageNotFetchedError):
+        fetched_page_client.serve({url: responses[0]}, fetched_page_client.get, 'https://www.punters.com.au/')
+    with pytest.raises(http_utils.PageNotFetchedError):
+        fetched_page_client.get(url)
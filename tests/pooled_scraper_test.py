@@ -0,0 +1,38 @@
+from lxml import html
+import predictive_punter
+from predictive_punter.http_utils import HTTPResponse
+import pytest
+import requests
+
+
+class HTTPClient:
+
+    def __init__(self, status_code):
+
+        self.status_code = status_code
+        self.urls = []
+
+    def get(self, url):
+        self.urls.append(url)
+        return HTTPResponse(url, self.status_code, '<html><body>page</body></html>')
+
+
+def test_get_html():
+    """The PooledScraper should return the parsed page for a successful response"""
+
+    scraper = predictive_punter.PooledScraper(HTTPClient(200), html.fromstring, concurrent_requests=3)
+
+    assert scraper.get_html('https://www.punters.com.au/').text_content() == 'page'
+    assert scraper.request_lock._value == 3
+
+
+def test_get_html_does_not_retry():
+    """The PooledScraper should raise the first failed response without retrying it"""
+
+    http_client = HTTPClient(429)
+    scraper = predictive_punter.PooledScraper(http_client, html.fromstring)
+
+    with pytest.raises(requests.HTTPError):
+        scraper.get_html('https://www.punters.com.au/')
+
+    assert http_client.urls == ['https://www.punters.com.au/']
@@ -0,0 +1,50 @@
+import concurrent.futures
+from datetime import datetime
+
+from lxml import html
+import predictive_punter
+from predictive_punter.http_utils import HTTPResponse
+import punters_client
+import pytest
+import pytz
+import requests
+
+
+PAGES = {
+    'https://www.punters.com.au/racing-results/2016-02-01/': '<html><body><a class="label-link" href="/racing-results/victoria/kilmore/2016-02-01/">Kilmore</a></body></html>',
+    'https://www.punters.com.au/racing-results/victoria/kilmore/2016-02-01/': '<html><body><table class="results-table"><thead><tr><th><b class="capitalize">Race 5</b><div class="details-line"><span class="capitalize">Total $20k</span><span class="capitalize">Good</span><span class="capitalize"><a href="/form-guide/race-5/">Form</a></span></div></th></tr></thead></table></body></html>',
+    'https://www.punters.com.au/form-guide/race-5/': '<html><body><span class="event-name-title"><strong>Maiden</strong></span><table class="form-guide-overview__table"><tbody><tr><td class="form-guide-overview__competitor-number">1.</td><td class="form-guide-overview__competitor-weight">57</td><td><a class="form-guide-overview__horse-link" href="/horses/horse/">Horse</a><a class="form-guide-overview__jockey-link" href="/jockeys/jockey/">Jockey</a><a class="form-guide-overview__trainer-link" href="/trainers/trainer/">Trainer</a></td></tr></tbody></table></body></html>'
+}
+
+
+class HTTPClient:
+
+    def get(self, url):
+        return HTTPResponse(url, 200 if url in PAGES else 404, PAGES.get(url, ''))
+
+
+@pytest.fixture(scope='module')
+def process_pool():
+
+    with concurrent.futures.ProcessPoolExecutor(2) as process_pool:
+        yield process_pool
+
+
+def test_scrape_races(process_pool):
+    """The ProcessPoolScraper should return the same values as the punters_client Scraper, fetching nested pages as required"""
+
+    local_timezone = pytz.timezone('Australia/Melbourne')
+    scraper = punters_client.Scraper(HTTPClient(), html.fromstring, local_timezone)
+    process_pool_scraper = predictive_punter.ProcessPoolScraper(HTTPClient(), process_pool, local_timezone)
+
+    meets = process_pool_scraper.scrape_meets(datetime(2016, 2, 1))
+    assert meets == scraper.scrape_meets(datetime(2016, 2, 1))
+
+    races = process_pool_scraper.scrape_races(meets[0])
+    assert races == scraper.scrape_races(meets[0])
+    assert races[0]['group'] == 'Maiden'
+
+    assert process_pool_scraper.scrape_runners(races[0]) == scraper.scrape_runners(races[0])
+
+    with pytest.raises(requests.HTTPError):
+        process_pool_scraper.scrape_profile('https://www.punters.com.au/horses/horse/')
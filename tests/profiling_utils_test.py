@@ -0,0 +1,93 @@
+import json
+import pstats
+import threading
+
+from predictive_punter import profiling_utils
+
+
+def test_disabled():
+    """Metrics should not record anything while disabled"""
+
+    metrics = profiling_utils.Metrics()
+    metrics.record('stage', 1.0)
+    metrics.increment('stage')
+
+    assert metrics.summarize() == {'counters': {}, 'durations': {}}
+
+
+def test_summarize():
+    """The summarize method should return the count, total, mean, max and percentiles of the durations recorded for each stage"""
+
+    metrics = profiling_utils.Metrics()
+    metrics.enabled = True
+    for duration in range(1, 101):
+        metrics.record('stage', float(duration))
+    metrics.increment('stage', 2)
+
+    summary = metrics.summarize()
+
+    assert summary['counters'] == {'stage': 2}
+    assert summary['durations']['stage']['count'] == 100
+    assert summary['durations']['stage']['total'] == 5050.0
+    assert summary['durations']['stage']['max'] == 100.0
+    assert summary['durations']['stage']['p50'] == 50.5
+    assert json.loads(metrics.to_json()) == summary
+    assert 'predictive_punter_stage_seconds_count{stage="stage"} 100' in metrics.to_prometheus().splitlines()
+
+
+def test_duration_summary():
+    """The DurationSummary should keep exact totals but only a bounded reservoir of durations, including when merging summaries"""
+
+    summaries = [profiling_utils.DurationSummary(100) for count in range(2)]
+    for duration in range(1, 1001):
+        summaries[0].record(float(duration))
+        summaries[1].record(float(duration + 1000))
+    summaries[0].merge(summaries[1])
+
+    assert summaries[0].count == 2000
+    assert summaries[0].total == sum(range(1, 2001))
+    assert (summaries[0].min, summaries[0].max) == (1.0, 2000.0)
+    assert len(summaries[0].reservoir) == 100
+    assert 500 < summaries[0].percentile(50) < 1500
+
+
+def test_log_time():
+    """The log_time function should return the target's output and record its duration for a stage named after the target"""
+
+    def target(value):
+        return value * 2
+
+    profiling_utils.metrics.enabled = True
+    try:
+        profiling_utils.metrics.pop_state()
+        assert profiling_utils.log_time('doubling {0}', target, 2) == 4
+        assert profiling_utils.metrics.pop_state()['durations']['target'].count == 1
+
+    finally:
+        profiling_utils.metrics.enabled = False
+
+
+def test_thread_profiler(tmpdir):
+    """The ThreadProfiler should merge the profiles of all threads and worker processes into a single report"""
+
+    def target():
+        return sum(range(1000))
+
+    worker_profiler = profiling_utils.ThreadProfiler()
+    worker_profiler.profile(target)
+
+    profiler = profiling_utils.ThreadProfiler()
+    threads = [threading.Thread(target=profiler.profile, args=(profiler.profile, target)) for count in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    profiler.merge_stats(worker_profiler.pop_stats())
+
+    path = str(tmpdir.join('profile'))
+    profiler.dump(path)
+
+    target_stats = [value for key, value in pstats.Stats(path).stats.items() if key[2] == 'target']
+    assert len(target_stats) == 1
+    assert target_stats[0][1] == 5
+    assert 'target' in tmpdir.join('profile.txt').read()
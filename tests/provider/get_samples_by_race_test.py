@@ -0,0 +1,30 @@
+import predictive_punter
+
+
+def test_cached(race, provider):
+    """The get_samples_by_race method should cache each sample on its runner"""
+
+    samples = provider.get_samples_by_race(race)
+
+    for runner, sample in zip(race.active_runners, samples):
+        assert runner.sample is sample
+        assert sample.runner is runner
+
+
+def test_persistence(race, provider):
+    """The get_samples_by_race method should return the same samples as get_sample_by_runner"""
+
+    samples = provider.get_samples_by_race(race)
+
+    for runner, sample in zip(race.active_runners, samples):
+        assert provider.get_sample_by_runner(runner)['_id'] == sample['_id']
+
+
+def test_types(race, provider):
+    """The get_samples_by_race method should return a list of Sample objects for all active runners in the race"""
+
+    samples = provider.get_samples_by_race(race)
+
+    assert len(samples) == len(race.active_runners)
+    for sample in samples:
+        assert isinstance(sample, predictive_punter.Sample)
@@ -1,4 +1,7 @@
+from datetime import datetime
+
 import predictive_punter
+import racing_data
 
 
 def test_indexes(provider):
@@ -15,3 +18,29 @@ def test_indexes(provider):
         index_keys = [index['key'] for index in collection.index_information().values()]
         for expected_index in expected_indexes[entity_type]:
             assert expected_index in index_keys
+
+
+def test_unique_indexes(provider):
+    """The provider should create unique indexes for entities that may be created by several processes at once"""
+
+    for entity_type in provider.unique_keys:
+        collection = provider.get_database_collection(entity_type)
+        unique_index_keys = [[key for key, direction in index['key']] for index in collection.index_information().values() if index.get('unique', False)]
+        assert list(provider.unique_keys[entity_type]) in unique_index_keys
+
+
+def test_replace_non_unique_index(provider):
+    """The provider should remove duplicate documents before replacing a non-unique index created by an earlier version with a unique one"""
+
+    collection = provider.get_database_collection(racing_data.Trainer)
+    collection.drop_index([('url', 1)])
+    collection.create_index([('url', 1)])
+    collection.insert_many([
+        {'url': 'https://www.punters.com.au/trainers/duplicate/', 'updated_at': datetime(2016, 2, 1)},
+        {'url': 'https://www.punters.com.au/trainers/duplicate/', 'updated_at': datetime(2016, 2, 2)}
+    ])
+
+    provider.create_database_indexes()
+
+    assert [values['updated_at'] for values in collection.find({'url': 'https://www.punters.com.au/trainers/duplicate/'})] == [datetime(2016, 2, 2)]
+    assert any(index['key'] == [('url', 1)] and index.get('unique', False) for index in collection.index_information().values())
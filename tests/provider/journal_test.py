@@ -0,0 +1,43 @@
+import predictive_punter
+
+
+def test_pop_journal(sample, provider):
+    """The pop_journal method should return the IDs of all entities written since the journal was last popped, and clear the journal"""
+
+    provider.journal_changes = True
+    try:
+        provider.pop_journal()
+        provider.save(sample)
+        provider.flush()
+
+        assert provider.pop_journal() == {provider.get_database_collection(predictive_punter.Sample).name: set([sample['_id']])}
+        assert provider.pop_journal() == {}
+
+    finally:
+        provider.journal_changes = False
+
+
+def test_journal_disabled(sample, provider):
+    """The provider should not journal any changes unless changes are being journaled for incremental backups"""
+
+    provider.pop_journal()
+    provider.save(sample)
+    provider.flush()
+
+    assert provider.pop_journal() == {}
+
+
+def test_journal_failures(race, provider):
+    """The provider should journal the failures it saves and removes, so that incremental restores roll them back"""
+
+    provider.journal_changes = True
+    try:
+        provider.pop_journal()
+        provider.save_failure('TestCommand', race, 'error')
+        failure_ids = provider.pop_journal()['failures']
+        provider.remove_failure('TestCommand', race)
+
+        assert provider.pop_journal() == {'failures': failure_ids}
+
+    finally:
+        provider.journal_changes = False
@@ -0,0 +1,37 @@
+import numpy
+import sklearn.preprocessing
+
+
+def test_imputed_query_data(race, provider):
+    """The prepare_race_samples method should replace all None values in the raw query data with the mean of the other active runners' values"""
+
+    samples = provider.prepare_race_samples(race)
+
+    for sample in samples:
+        for index in range(len(sample['raw_query_data'])):
+            if sample['raw_query_data'][index] is None:
+                other_values = [other_sample['raw_query_data'][index] for other_sample in samples if other_sample['raw_query_data'][index] is not None]
+                expected_value = sum(other_values) / len(other_values) if len(other_values) > 0 else 0.0
+                assert sample['imputed_query_data'][index] == expected_value
+            else:
+                assert sample['imputed_query_data'][index] == sample['raw_query_data'][index]
+
+
+def test_normalized_query_data(race, provider):
+    """The prepare_race_samples method should normalize the imputed query data for all active runners in the race together"""
+
+    samples = provider.prepare_race_samples(race)
+
+    expected_values = sklearn.preprocessing.normalize(numpy.asarray([sample['imputed_query_data'] for sample in samples]), axis=0).tolist()
+
+    for index in range(len(samples)):
+        assert samples[index]['normalized_query_data'] == expected_values[index]
+
+
+def test_persistence(race, provider):
+    """The prepare_race_samples method should save the imputed and normalized query data for all active runners in the race"""
+
+    for sample in provider.prepare_race_samples(race):
+        saved_sample = provider.get_database_collection(sample.__class__).find_one({'_id': sample['_id']})
+        for key in ('imputed_query_data', 'normalized_query_data'):
+            assert saved_sample[key] == sample[key]
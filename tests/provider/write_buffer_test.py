@@ -0,0 +1,26 @@
+import predictive_punter
+
+
+def test_find_pending(sample, runner, provider):
+    """The find_one method should return pending changes to buffered entities before they are flushed"""
+
+    regression_result = sample['regression_result']
+    sample['regression_result'] = -1.0
+    provider.save(sample)
+
+    try:
+        assert provider.find_one(predictive_punter.Sample, {'runner_id': runner['_id']}, None)['regression_result'] == -1.0
+
+    finally:
+        sample['regression_result'] = regression_result
+        provider.save(sample)
+
+
+def test_flush(sample, provider):
+    """The flush method should write all pending entities in the write buffer to the database"""
+
+    provider.save(sample)
+    provider.flush()
+
+    assert len(provider.write_buffer) == 0
+    assert provider.get_database_collection(predictive_punter.Sample).find_one({'_id': sample['_id']})['regression_result'] == sample['regression_result']
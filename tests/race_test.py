@@ -1,3 +1,8 @@
+from datetime import datetime
+
+import pytz
+
+
 def calculate_value(race, places):
     """Calculate the value of the race for the winning combination with the specified number of places"""
 
@@ -37,6 +42,24 @@ def test_get_winning_combinations(race):
         assert winning_combinations[0] == tuple([results[index] for index in range(places)])
 
 
+def test_generate_winning_combinations(race):
+    """The generate_winning_combinations method should generate the same winning combinations returned by get_winning_combinations"""
+
+    for places in range(1, 5):
+        assert list(race.generate_winning_combinations(places)) == race.get_winning_combinations(places)
+
+
+def test_get_placings(race):
+    """The get_placings method should return a list of (runners, count) tuples covering the specified number of places"""
+
+    for places in range(1, 5):
+        placings = race.get_placings(places)
+        assert sum([count for runners, count in placings]) == places
+        for runners, count in placings:
+            for runner in runners:
+                assert runner in race.active_runners
+
+
 def test_win_value(race):
     """The win_value property should return the sum of the starting prices of each winner less the number of winners"""
 
@@ -65,3 +88,21 @@ def test_total_value(race):
     """The total_value property should return the sum of win, exacta, trifecta and first four values"""
 
     assert race.total_value == race.win_value + race.exacta_value + race.trifecta_value + race.first_four_value
+
+
+def test_winning_values(race):
+    """The winning_values property should return a list of the win, exacta, trifecta and first four values calculated in a single pass"""
+
+    assert race.winning_values == race.calculate_values(4) == [race.calculate_value(places) for places in range(1, 5)]
+
+
+def test_has_winning_values(race):
+    """The has_winning_values property should return True only if winning values were persisted since the race was last updated"""
+
+    values = dict(race, winning_values=[1.0, 2.0, 3.0, 4.0], winning_values_updated_at=race['updated_at'])
+    persisted_race = race.__class__(race.provider, None, values)
+    assert persisted_race.has_winning_values is True
+    assert persisted_race.winning_values == [1.0, 2.0, 3.0, 4.0]
+
+    persisted_race['updated_at'] = datetime.now(pytz.utc)
+    assert persisted_race.has_winning_values is False
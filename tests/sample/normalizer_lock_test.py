@@ -0,0 +1,48 @@
+import threading
+import time
+
+import predictive_punter
+
+
+def test_exclusive():
+    """The normalizer lock for a race should only be held by one thread at a time"""
+
+    race = {'_id': 'race'}
+    holders = []
+    overlaps = []
+
+    def normalize():
+        with predictive_punter.Sample.get_normalizer_lock(race):
+            holders.append(threading.current_thread())
+            if len(holders) > 1:
+                overlaps.append(list(holders))
+            time.sleep(0.01)
+            holders.remove(threading.current_thread())
+
+    threads = [threading.Thread(target=normalize) for index in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(overlaps) == 0
+
+
+def test_reentrant():
+    """The normalizer lock for a race should be re-entrant within a thread"""
+
+    race = {'_id': 'race'}
+
+    with predictive_punter.Sample.get_normalizer_lock(race):
+        with predictive_punter.Sample.get_normalizer_lock(race):
+            assert len(predictive_punter.Sample.normalizer_locks) == 1
+
+
+def test_eviction():
+    """The normalizer lock for a race should be discarded once it is no longer held"""
+
+    for index in range(100):
+        with predictive_punter.Sample.get_normalizer_lock({'_id': index}):
+            pass
+
+    assert len(predictive_punter.Sample.normalizer_locks) == 0
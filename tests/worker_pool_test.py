@@ -0,0 +1,49 @@
+import threading
+
+import predictive_punter
+
+
+def test_bounded_threads():
+    """The worker pool should never process items in more threads than its maximum number of workers plus the submitting thread"""
+
+    worker_pool = predictive_punter.WorkerPool(2)
+    thread_ids = set()
+
+    def process_item(item):
+        thread_ids.add(threading.get_ident())
+        return item
+
+    futures = [worker_pool.submit(process_item, item) for item in range(100)]
+    worker_pool.shutdown()
+
+    assert [future.result() for future in futures] == list(range(100))
+    assert len(thread_ids) <= 3
+
+
+def test_exceptions():
+    """The worker pool should set exceptions raised by submitted targets on the returned future"""
+
+    worker_pool = predictive_punter.WorkerPool(1)
+
+    def raise_error():
+        raise ValueError()
+
+    futures = [worker_pool.submit(raise_error) for count in range(2)]
+    worker_pool.shutdown()
+
+    for future in futures:
+        assert isinstance(future.exception(), ValueError)
+
+
+def test_nested_submissions():
+    """The worker pool should process nested submissions without deadlocking when all workers are busy"""
+
+    worker_pool = predictive_punter.WorkerPool(1)
+
+    def process_children(item):
+        return sum(future.result() for future in [worker_pool.submit(lambda child: child, item * 10 + child) for child in range(5)])
+
+    futures = [worker_pool.submit(process_children, item) for item in range(5)]
+
+    assert [future.result(timeout=10) for future in futures] == [sum(item * 10 + child for child in range(5)) for item in range(5)]
+    worker_pool.shutdown()